@@ -1,14 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, Response, abort, g, render_template, request, redirect, url_for, session, flash, jsonify
 from flask_sqlalchemy import SQLAlchemy
 # احذف: from flask_migrate import Migrate
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import math
 import os
-import uuid
-from werkzeug.utils import secure_filename
 from config import config
 from models import db, MenuItem, Order, Settings
-from database import init_database, get_settings, update_setting
+from database import (init_database, configure_sqlite, get_settings, get_setting, update_setting, settings_revision,
+                      get_orders_page,
+                      get_orders_feed_state, get_orders_changed_since, get_orders_to_deliver,
+                      get_order_tracking,
+                      normalize_tracking_code, tracking_cache)
+from events import init_events, stream_events
+from catalog import menu_catalog
+from stats import get_dashboard_stats, get_sales, stats_cache
+from cli import register_commands
+from images import image_pipeline
+from assets import asset_manifest
+from pagecache import cached_page, page_cache
+from cart import Cart, init_cart_store
+from dbstats import db_stats
+from metrics import metrics
+from ordercommit import OrderPending, order_committer
+from i18n import translations
+from kitchen import kitchen_queue
+from delivery import AWAITING_DRIVER_STATUSES, delivery_zones, valid_position
+from pricing import init_pricing, quote_cart
+from search import menu_search
+from jobs import job_queue
+from notifications import init_notifications, notify_order
 
 def create_app(config_name=None):
     app = Flask(__name__)
@@ -17,76 +38,87 @@ def create_app(config_name=None):
     config_name = config_name or os.environ.get('FLASK_ENV', 'default')
     app.config.from_object(config[config_name])
     
+    # Per-request query count, SQL time and pool wait (installs the pool class,
+    # so it runs before the engine is created)
+    db_stats.init_app(app)
+    
+    # Prometheus metrics at /metrics
+    metrics.init_app(app)
+    
     # Initialize extensions
     db.init_app(app)
+    configure_sqlite(app)
     # احذف: migrate = Migrate(app, db)
     
-    # Initialize database
-    init_database(app)
+    # Initialize database (request-serving workers skip this in production;
+    # the deploy runs `flask init-db` once instead)
+    if app.config['RUN_MIGRATIONS_ON_STARTUP']:
+        init_database(app)
+    
+    # Live order events for the admin dashboard
+    init_events(app)
+    
+    # Background jobs (customer notifications) outside the request
+    job_queue.init_app(app)
+    init_notifications(app)
+    
+    # Direct or group-committed order placement
+    order_committer.init_app(app)
+    
+    # Interface translations (translations/<language>.json)
+    translations.init_app(app)
+    
+    # Cached menu for the customer-facing pages
+    menu_catalog.init_app(app)
+    
+    # Ready-time estimates from the open-order queue
+    kitchen_queue.init_app(app)
+    
+    # Delivery zones and fees (polygons in the 'delivery_zones' setting)
+    delivery_zones.init_app(app)
+    
+    # Server-side cart prices, cached per cart state
+    init_pricing(app)
+    
+    stats_cache.ttl = app.config['STATS_CACHE_SECONDS']
+    tracking_cache.ttl = app.config['TRACKING_CACHE_SECONDS']
+    page_cache.max_bytes = app.config['PAGE_CACHE_MAX_BYTES']
+    
+    # Uploaded menu images and their responsive variants
+    image_pipeline.init_app(app)
+    
+    # Server-side carts (the cookie only carries the cart id)
+    init_cart_store(app)
+    
+    # Fingerprinted, precompressed static assets
+    asset_manifest.init_app(app)
+    
+    # flask CLI maintenance commands
+    register_commands(app)
     
     return app
 
 app = create_app()
 
-# Load settings from database
-with app.app_context():
-    SETTINGS = get_settings()
-    RESTAURANT_INFO = SETTINGS.get('restaurant_info', {})
-    ADMIN_CREDENTIALS = SETTINGS.get('admin_credentials', {'username': 'admin', 'password': 'admin'})
-    ADMIN_USERNAME = ADMIN_CREDENTIALS['username']
-    ADMIN_PASSWORD = ADMIN_CREDENTIALS['password']
-
-# Languages
-LANGUAGES = {
-    'ar': {
-        'name': 'العربية',
-        'home': 'الرئيسية',
-        'menu': 'القائمة',
-        'cart': 'السلة',
-        'admin': 'الإدارة',
-        'language': 'اللغة',
-        'order_success': 'تم إرسال طلبك بنجاح!',
-        'order_updated': 'تم تحديث حالة الطلب',
-        'item_added': 'تم إضافة العنصر بنجاح',
-        'item_updated': 'تم تحديث العنصر بنجاح',
-        'item_deleted': 'تم حذف العنصر بنجاح',
-        'added_to_cart': 'تم إضافة الوجبة إلى السلة',
-        'cart_updated': 'تم تحديث السلة',
-        'cart_empty': 'السلة فارغة',
-        'currency': 'د.م'
-    },
-    'fr': {
-        'name': 'Français',
-        'home': 'Accueil',
-        'menu': 'Menu',
-        'cart': 'Panier',
-        'admin': 'Administration',
-        'language': 'Langue',
-        'order_success': 'Votre commande a été envoyée avec succès!',
-        'order_updated': 'Statut de la commande mis à jour',
-        'item_added': 'Article ajouté avec succès',
-        'item_updated': 'Article mis à jour avec succès',
-        'item_deleted': 'Article supprimé avec succès',
-        'added_to_cart': 'Plat ajouté au panier',
-        'cart_updated': 'Panier mis à jour',
-        'cart_empty': 'Panier vide',
-        'currency': 'MAD'
-    }
-}
-
 def get_language():
-    return session.get('language', 'ar')
+    return translations.language()
 
 def get_text(key):
-    return LANGUAGES.get(get_language(), {}).get(key, key)
+    return translations.gettext(key)
+
+def localized_menu():
+    """The menu with item names, descriptions and categories in the visitor's language"""
+    return menu_catalog.get().localized(get_language())
 
 @app.context_processor
 def inject_language():
     return {
         'get_language': get_language,
         'get_text': get_text,
-        'languages': LANGUAGES,
-        'restaurant_info': RESTAURANT_INFO
+        'languages': translations.catalogs,
+        'restaurant_info': get_setting('restaurant_info', {}),
+        'image_srcset': image_pipeline.srcset,
+        'cart_count': cart_count
     }
 
 # Authentication
@@ -101,149 +133,316 @@ def login_required(f):
     return decorated_function
 
 def check_admin_credentials(username, password):
-    # Refresh credentials from database
-    with app.app_context():
-        settings = get_settings()
-        admin_creds = settings.get('admin_credentials', {})
-        return (username == admin_creds.get('username') and 
-                password == admin_creds.get('password'))
+    # Cached per key and revalidated against the database on each call
+    admin_creds = get_setting('admin_credentials', {})
+    return (username == admin_creds.get('username') and 
+            password == admin_creds.get('password'))
 
 # File upload configuration
-UPLOAD_FOLDER = 'static/images'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+def kitchen_eta(order_id):
+    """Estimated ready time of an order (None if it is not in the kitchen)"""
+    try:
+        return kitchen_queue.eta(order_id)
+    except Exception as e:
+        print(f"Kitchen ETA error: {e}")
+        return None
+
+def update_kitchen_queue(order):
+    """Apply a committed new order or status change to the ETA queue"""
+    try:
+        kitchen_queue.order_changed(order)
+    except Exception as e:
+        # Other workers still get it from the order event, or at the next resync
+        print(f"Kitchen queue update error: {e}")
+
+def order_payload(order):
+    """Order as sent to the admin dashboard, with its kitchen ETA"""
+    payload = order.to_dict()
+    payload['eta'] = kitchen_eta(order.id)
+    return payload
+
+def publish_order_event(kind, order):
+    """Push an order change to connected admin screens"""
+    try:
+        app.extensions['order_events'].publish(kind, order_payload(order))
+    except Exception as e:
+        # The order itself is already committed; live updates are best effort
+        print(f"Order event publish error: {e}")
+
+@order_committer.on_placed
+def order_placed(order):
+    """Kitchen queue, live dashboard and metrics of a newly committed order"""
+    update_kitchen_queue(order)
+    publish_order_event('order_created', order)
+    metrics.record_order(order)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def delete_menu_image(filename, item_id):
+    """Delete an image and its variants unless another menu item still uses it"""
+    # Uploads are named by content hash, so identical files are shared
+    in_use = MenuItem.query.filter(MenuItem.image == filename, MenuItem.id != item_id).first()
+    if not in_use:
+        image_pipeline.delete(filename)
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query parameter, ignoring empty or invalid values"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+def parse_number(value):
+    """Parse a numeric query parameter, ignoring empty, invalid or non-finite values"""
+    try:
+        number = float(value) if value else None
+    except ValueError:
+        return None
+    return number if number is None or math.isfinite(number) else None
+
+def parse_position(latitude, longitude):
+    """(lat, lng) of a position picked at checkout.
+    
+    (None, None) when none was picked; None when a coordinate is missing,
+    invalid or out of range.
+    """
+    if not latitude and not longitude:
+        return None, None
+    lat, lng = parse_number(latitude), parse_number(longitude)
+    if lat is None or lng is None or not valid_position(lat, lng):
+        return None
+    return lat, lng
+
+def get_cart():
+    """The visitor's server-side cart, loaded at most once per request"""
+    if 'cart' not in g:
+        # Drop carts stored in the cookie by earlier versions
+        session.pop('cart', None)
+        cart_id = session.get('cart_id')
+        cart = app.extensions['cart_store'].load(cart_id) if cart_id else None
+        g.cart = cart or Cart()
+    return g.cart
+
+def save_cart(cart):
+    app.extensions['cart_store'].save(cart)
+    session['cart_id'] = cart.id
+
+def clear_cart():
+    app.extensions['cart_store'].delete(get_cart())
+    session.pop('cart_id', None)
+    g.pop('cart', None)
+
+def cart_count():
+    return len(get_cart()) if 'cart_id' in session else 0
+
+def cart_quote(latitude=None, longitude=None):
+    """Server-side price of the visitor's cart (cached per cart version)"""
+    return quote_cart(get_cart(), menu_catalog.get(), latitude, longitude)
+
+def quoted_items(quote):
+    """Quoted cart lines, with item names in the visitor's language"""
+    view = localized_menu()
+    return [dict(item, name=(view.get_item(item['id']) or item)['name'])
+            for item in quote.to_dict()['items']]
+
+def page_cache_key(category=None):
+    """Cache key of an anonymous menu page, or None when it is personalised"""
+    if session.get('_flashes') or cart_count():
+        return None
+    # Revalidates the cached restaurant info shown in the layout
+    get_setting('restaurant_info', {})
+    return (category, get_language(), menu_catalog.get().version,
+            settings_revision('restaurant_info'))
+
 # Routes
 @app.route('/')
+@cached_page(page_cache_key)
 def home():
     # Get featured menu items
-    featured_items = MenuItem.query.filter_by(available=True).limit(6).all()
-    return render_template('index.html', featured_items=[item.to_dict() for item in featured_items])
+    catalog = localized_menu()
+    return render_template('index.html', featured_items=catalog.featured)
 
 @app.route('/menu')
 @app.route('/menu/<category>')
+@cached_page(page_cache_key)
 def menu(category=None):
+    catalog = localized_menu()
     if category:
-        menu_items = MenuItem.query.filter_by(category=category, available=True).all()
+        menu_items = catalog.get_category(category)
     else:
-        menu_items = MenuItem.query.filter_by(available=True).all()
-    
-    # Get unique categories
-    categories = db.session.query(MenuItem.category).filter_by(available=True).distinct().all()
-    categories = [cat[0] for cat in categories]
+        menu_items = catalog.available
     
     return render_template('menu.html', 
-                         menu=[item.to_dict() for item in menu_items], 
-                         categories=categories, 
+                         menu=menu_items, 
+                         categories=catalog.categories, 
+                         category_labels=catalog.category_labels,
                          current_category=category)
 
+@app.route('/api/menu/search')
+def api_menu_search():
+    """Search the menu by text (Arabic or French) with price and prep-time filters"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    items = menu_search.search(
+        menu_catalog.get(),
+        query=request.args.get('q', ''),
+        language=get_language(),
+        category=request.args.get('category') or None,
+        min_price=parse_number(request.args.get('min_price')),
+        max_price=parse_number(request.args.get('max_price')),
+        max_prep_time=parse_number(request.args.get('max_prep_time')),
+        available_only=request.args.get('available', '1') != '0',
+        limit=limit
+    )
+    return jsonify({
+        'query': request.args.get('q', ''),
+        'count': len(items),
+        'items': [{
+            'id': item['id'],
+            'name': item['name'],
+            'description': item['description'],
+            'category': item['category'],
+            'category_key': item['category_key'],
+            'price': item['price'],
+            'image': item['image'],
+            'available': item['available'],
+            'preparation_time': item['preparation_time'],
+            'ingredients': item['ingredients']
+        } for item in items]
+    })
+
 @app.route('/add_to_cart', methods=['POST'])
 def add_to_cart():
-    item_id = int(request.form['item_id'])
-    quantity = int(request.form.get('quantity', 1))
-    
-    # Get item from database
-    item = MenuItem.query.get_or_404(item_id)
-    
-    if 'cart' not in session:
-        session['cart'] = []
-    
-    cart = session['cart']
+    item_id = request.form.get('item_id', type=int)
+    quantity = request.form.get('quantity', type=int) if 'quantity' in request.form else 1
+    if item_id is None or quantity is None or quantity < 1:
+        abort(400)
     
-    # Check if item already in cart
-    found = False
-    for cart_item in cart:
-        if cart_item['id'] == item_id:
-            cart_item['quantity'] += quantity
-            found = True
-            break
+    # Only items on the menu can be added
+    item = menu_catalog.get().get_item(item_id)
+    if item is None:
+        abort(404)
     
-    if not found:
-        cart.append({
-            'id': item_id,
-            'name': item.name,
-            'price': item.price,
-            'quantity': quantity,
-            'image': item.image
-        })
-    
-    session['cart'] = cart
-    session.modified = True
+    cart = get_cart()
+    cart.add(item_id, quantity)
+    save_cart(cart)
     
     flash(get_text('added_to_cart'), 'success')
     return redirect(url_for('menu'))
 
 @app.route('/cart')
 def cart():
-    cart_items = session.get('cart', [])
-    total = sum(item['price'] * item['quantity'] for item in cart_items)
-    return render_template('cart.html', cart=cart_items, total=total)
+    quote = cart_quote()
+    return render_template('cart.html', cart=quoted_items(quote), quote=quote.to_dict())
 
 @app.route('/update_cart', methods=['POST'])
 def update_cart():
-    cart = session.get('cart', [])
-    
-    for i, item in enumerate(cart):
-        quantity_key = f'quantity_{item["id"]}'
+    cart = get_cart()
+    
+    # Quantity form (item_id + quantity) and remove buttons (quantity_<id>=0)
+    changes = {}
+    if 'item_id' in request.form and 'quantity' in request.form:
+        changes[request.form.get('item_id', type=int)] = request.form.get('quantity', type=int)
+    for item_id in list(cart.lines):
+        quantity_key = f'quantity_{item_id}'
         if quantity_key in request.form:
-            new_quantity = int(request.form[quantity_key])
-            if new_quantity > 0:
-                cart[i]['quantity'] = new_quantity
-            else:
-                cart.pop(i)
-                break
+            changes[item_id] = request.form.get(quantity_key, type=int)
+    # 0 removes a line; anything else must be a positive quantity
+    if any(item_id is None or quantity is None or quantity < 0 for item_id, quantity in changes.items()):
+        abort(400)
+    for item_id, quantity in changes.items():
+        cart.set_quantity(item_id, quantity)
     
-    session['cart'] = cart
-    session.modified = True
+    save_cart(cart)
     
     flash(get_text('cart_updated'), 'success')
     return redirect(url_for('cart'))
 
 @app.route('/checkout')
 def checkout():
-    cart_items = session.get('cart', [])
-    if not cart_items:
+    # Flat delivery fee until a position is picked (then /api/checkout/quote)
+    quote = cart_quote()
+    if not quote.lines:
         flash(get_text('cart_empty'), 'warning')
         return redirect(url_for('menu'))
     
-    total = sum(item['price'] * item['quantity'] for item in cart_items)
-    return render_template('checkout.html', cart_items=cart_items, total=total)
+    return render_template('checkout.html', cart_items=quoted_items(quote), quote=quote.to_dict())
+
+@app.route('/api/checkout/quote')
+def api_checkout_quote():
+    """Price of the cart delivered to the position picked at checkout"""
+    position = parse_position(request.args.get('lat'), request.args.get('lng'))
+    if position is None:
+        return jsonify({'error': 'invalid_position'}), 400
+    quote = cart_quote(*position)
+    return jsonify(dict(quote.to_dict(), items=quoted_items(quote)))
+
+@app.route('/api/delivery/quote')
+def api_delivery_quote():
+    """Delivery zone, distance and fee for a position picked at checkout"""
+    position = parse_position(request.args.get('lat'), request.args.get('lng'))
+    if position is None or position[0] is None:
+        return jsonify({'error': 'invalid_position'}), 400
+    return jsonify(delivery_zones.quote(*position))
 
 @app.route('/place_order', methods=['POST'])
 def place_order():
-    cart_items = session.get('cart', [])
-    if not cart_items:
+    position = parse_position(request.form.get('latitude'), request.form.get('longitude'))
+    if position is None:
+        abort(400)
+    latitude, longitude = position
+    
+    # Prices come from the current menu, not from when items were added; the
+    # quote shown at checkout for this position is reused from the cache
+    quote = cart_quote(latitude, longitude)
+    if not quote.lines:
         flash(get_text('cart_empty'), 'warning')
         return redirect(url_for('menu'))
+    if not quote.deliverable:
+        flash(get_text('outside_delivery_area'), 'error')
+        return redirect(url_for('checkout'))
+    if not quote.meets_minimum:
+        flash(f"{get_text('min_order_not_met')} ({quote.min_order_amount} {get_text('currency')})", 'warning')
+        return redirect(url_for('cart'))
+    
+    cart_items = quote.order_items()
+    total = float(quote.total)
+    delivery = quote.delivery
+    
+    values = {
+        'customer_name': request.form['customer_name'],
+        'customer_phone': request.form['customer_phone'],
+        'customer_address': request.form['customer_address'],
+        'items': json.dumps(cart_items, ensure_ascii=False),
+        'total_amount': total,
+        'notes': request.form.get('notes', ''),
+        'status': 'جديد',
+        'latitude': latitude,
+        'longitude': longitude,
+        'customer_location': request.form.get('location') or None,
+        'delivery_zone': delivery['zone'],
+        'delivery_distance_km': delivery['distance_km'],
+        'delivery_fee': float(quote.delivery_fee),
+        'discount_amount': float(quote.discount),
+        'tax_amount': float(quote.tax)
+    }
     
-    # Generate tracking code
-    tracking_code = str(uuid.uuid4())[:8].upper()
-    
-    # Calculate total
-    total = sum(item['price'] * item['quantity'] for item in cart_items)
-    
-    # Create order
-    order = Order(
-        tracking_code=tracking_code,
-        customer_name=request.form['customer_name'],
-        customer_phone=request.form['customer_phone'],
-        customer_address=request.form['customer_address'],
-        items=json.dumps(cart_items, ensure_ascii=False),
-        total_amount=total,
-        notes=request.form.get('notes', ''),
-        status='جديد'
-    )
-    
-    db.session.add(order)
-    db.session.commit()
+    # Create order (the tracking code is drawn when it is stored); the
+    # customer's notification job is committed with it
+    try:
+        order = order_committer.place(values, cart_items, menu_catalog.get().category_of,
+                                      before_commit=lambda new_order: notify_order('order_placed', new_order))
+    except OrderPending as e:
+        # Its batch may still commit: empty the cart so a retry cannot place
+        # it twice, and send the customer to its tracking page
+        clear_cart()
+        flash(f"{get_text('order_pending')} {e.tracking_code}", 'warning')
+        return redirect(url_for('track_order', code=e.tracking_code))
     
     # Clear cart
-    session.pop('cart', None)
+    clear_cart()
     
     # إنشاء قاموس order للقالب مع الحقول المطلوبة
     order_data = {
@@ -260,22 +459,46 @@ def place_order():
     }
     
     flash(get_text('order_success'), 'success')
-    return render_template('order_success.html', order=order_data, tracking_code=tracking_code)
+    return render_template('order_success.html', order=order_data, tracking_code=order.tracking_code)
 
 @app.route('/track_order', methods=['GET', 'POST'])
 def track_order():
     if request.method == 'POST':
-        tracking_code = request.form['tracking_code']
+        # Redirect to a GET page so refreshing it does not re-submit the form
+        return redirect(url_for('track_order', code=normalize_tracking_code(request.form['tracking_code'])))
+    
+    tracking_code = normalize_tracking_code(request.args.get('code'))
+    if tracking_code:
         order = Order.query.filter_by(tracking_code=tracking_code).first()
         
         if order:
-            return render_template('track_order.html', order=order.to_dict(), found=True)
+            return render_template('track_order.html', order=order.to_dict(), eta=kitchen_eta(order.id),
+                                   found=True)
         else:
             flash('رمز التتبع غير صحيح', 'error')
             return render_template('track_order.html', found=False)
     
     return render_template('track_order.html', found=False)
 
+@app.route('/api/track/<string(maxlength=20):code>')
+def api_track_order(code):
+    """Order status for the tracking page to poll (cached, ETag revalidated)"""
+    tracking = get_order_tracking(normalize_tracking_code(code))
+    if tracking is None:
+        return jsonify({'error': 'not_found'}), 404
+    
+    # The ETA moves with the rest of the queue, not only with this order
+    tracking = dict(tracking, eta=kitchen_eta(tracking['id']))
+    eta = tracking['eta']['ready_at'][:16] if tracking['eta'] else ''
+    etag = f"{tracking['tracking_code']}-{tracking['updated_at']}-{eta}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(tracking)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
@@ -298,8 +521,22 @@ def admin_logout():
 @app.route('/admin')
 @login_required
 def admin():
+    # فلاتر القائمة (الحالة والتاريخ) تُطبق في قاعدة البيانات
+    filters = {
+        'status': request.args.get('status') or None,
+        'date_from': parse_date(request.args.get('date_from')),
+        'date_to': parse_date(request.args.get('date_to'))
+    }
+    cursor = request.args.get('cursor')
+    
     try:
-        orders = Order.query.order_by(Order.created_at.desc()).all()
+        orders, next_cursor = get_orders_page(
+            cursor=cursor,
+            per_page=app.config['ADMIN_ORDERS_PER_PAGE'],
+            **filters
+        )
+        # Same cached computation as the dashboard's stats endpoint
+        order_stats = get_dashboard_stats()
         menu_items = MenuItem.query.all()  # إضافة قوائم الطعام
         
         # تحويل الطلبات إلى قواميس للعرض الصحيح
@@ -322,12 +559,90 @@ def admin():
             else:
                 order_dict['total'] = order.total_amount
             
+            order_dict['eta'] = kitchen_eta(order.id)
             orders_data.append(order_dict)
         
-        return render_template('admin.html', orders=orders_data, menu=menu_items)
+        return render_template('admin.html', orders=orders_data, menu=menu_items,
+                               order_stats=order_stats, next_cursor=next_cursor,
+                               cursor=cursor, filters=request.args,
+                               feed_cursor=order_stats['latest_update'] or '')
     except Exception as e:
         print(f"Admin route error: {e}")
-        return render_template('admin.html', orders=[], menu=[])
+        return render_template('admin.html', orders=[], menu=[],
+                               order_stats={'by_status': {}, 'total_orders': 0, 'total_sales': 0},
+                               next_cursor=None, cursor=None, filters=request.args,
+                               feed_cursor='')
+
+@app.route('/admin/orders/feed')
+@login_required
+def admin_orders_feed():
+    """Orders created or changed since the `since` cursor, for live admin updates"""
+    latest, count = get_orders_feed_state()
+    etag = f"{latest.isoformat() if latest else '0'}-{count}"
+    
+    # Nothing changed since the client's last poll
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    try:
+        since = datetime.fromisoformat(request.args['since'])
+    except (KeyError, ValueError):
+        since = None
+    
+    limit = 100
+    orders = get_orders_changed_since(since, limit=limit) if since else []
+    cursor = orders[-1].updated_at if orders else (since or latest)
+    has_more = len(orders) == limit
+    
+    response = jsonify({
+        'orders': [order_payload(order) for order in orders],
+        'cursor': cursor.isoformat() if cursor else None,
+        'has_more': has_more
+    })
+    # Only a complete delta may be revalidated against the current state
+    if not has_more:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/admin/orders/stream')
+@login_required
+def admin_orders_stream():
+    """Server-Sent Events stream of order changes for the admin dashboard"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    slots = app.extensions['event_stream_slots']
+    if slots is not None and not slots.acquire(blocking=False):
+        # Every stream thread is taken; the dashboard polls the feed instead
+        return Response(status=503, headers={'Retry-After': '30'})
+    
+    events = stream_events(
+        app.extensions['order_events'],
+        last_event_id=last_event_id,
+        max_duration=app.config['EVENT_STREAM_MAX_SECONDS']
+    )
+    response = Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # disable proxy buffering
+    })
+    if slots is not None:
+        # Runs when the response is closed, even if the stream never started
+        response.call_on_close(slots.release)
+    return response
+
+@app.route('/admin/delivery/routes')
+@login_required
+def admin_delivery_routes():
+    """Orders waiting for a driver, grouped into routes of nearby stops"""
+    orders = get_orders_to_deliver(AWAITING_DRIVER_STATUSES)
+    routes = delivery_zones.routes(orders)
+    return jsonify({'routes': routes, 'orders': sum(len(route['orders']) for route in routes)})
 
 @app.route('/update_order_status', methods=['POST'])
 @login_required
@@ -336,10 +651,17 @@ def update_order_status():
     new_status = request.form['status']
     
     order = Order.query.get_or_404(order_id)
+    status_changed = order.status != new_status
     order.status = new_status
     order.updated_at = datetime.utcnow()
+    if status_changed:
+        notify_order('order_status_changed', order)
     
     db.session.commit()
+    tracking_cache.delete(order.tracking_code)
+    update_kitchen_queue(order)
+    
+    publish_order_event('order_updated', order)
     
     flash(get_text('order_updated'), 'success')
     return redirect(url_for('admin'))
@@ -352,11 +674,8 @@ def add_menu_item():
     if 'image' in request.files:
         file = request.files['image']
         if file and file.filename != '' and allowed_file(file.filename):
-            # Generate unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = secure_filename(file.filename)
-            image_filename = f"{timestamp}_{filename}"
-            file.save(os.path.join(UPLOAD_FOLDER, image_filename))
+            # Stored under its content hash; resized variants are made in the background
+            image_filename = image_pipeline.save_upload(file)
     
     # Create menu item
     menu_item = MenuItem(
@@ -374,6 +693,7 @@ def add_menu_item():
     )
     
     db.session.add(menu_item)
+    menu_catalog.touch()
     db.session.commit()
     
     flash(get_text('item_added'), 'success')
@@ -389,17 +709,10 @@ def edit_menu_item():
     if 'image' in request.files:
         file = request.files['image']
         if file and file.filename != '' and allowed_file(file.filename):
-            # Delete old image
-            if item.image:
-                old_image_path = os.path.join(UPLOAD_FOLDER, item.image)
-                if os.path.exists(old_image_path):
-                    os.remove(old_image_path)
-            
-            # Save new image
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = secure_filename(file.filename)
-            image_filename = f"{timestamp}_{filename}"
-            file.save(os.path.join(UPLOAD_FOLDER, image_filename))
+            # Save new image, then delete the old one with its variants
+            image_filename = image_pipeline.save_upload(file)
+            if item.image and item.image != image_filename:
+                delete_menu_image(item.image, item.id)
             item.image = image_filename
     
     # Update item
@@ -415,6 +728,7 @@ def edit_menu_item():
     item.ingredients_fr = json.dumps(request.form.get('ingredients_fr', '').split(','), ensure_ascii=False)
     item.available = 'available' in request.form
     
+    menu_catalog.touch()
     db.session.commit()
     
     flash(get_text('item_updated'), 'success')
@@ -426,13 +740,12 @@ def delete_menu_item():
     item_id = int(request.form['item_id'])
     item = MenuItem.query.get_or_404(item_id)
     
-    # Delete image file
+    # Delete image file and its variants
     if item.image:
-        image_path = os.path.join(UPLOAD_FOLDER, item.image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        delete_menu_image(item.image, item.id)
     
     db.session.delete(item)
+    menu_catalog.touch()
     db.session.commit()
     
     flash(get_text('item_deleted'), 'success')
@@ -445,6 +758,7 @@ def toggle_item_availability():
     item = MenuItem.query.get_or_404(item_id)
     
     item.available = not item.available
+    menu_catalog.touch()
     db.session.commit()
     
     return jsonify({'success': True, 'available': item.available})
@@ -452,19 +766,25 @@ def toggle_item_availability():
 @app.route('/get_order_stats')
 @login_required
 def get_order_stats():
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='جديد').count()
-    completed_orders = Order.query.filter_by(status='تم التوصيل').count()
-    
-    return jsonify({
-        'total_orders': total_orders,
-        'pending_orders': pending_orders,
-        'completed_orders': completed_orders
-    })
+    # Rolling window in days, bounded to keep the grouped queries cheap
+    days = min(max(request.args.get('days', 7, type=int), 1), 90)
+    return jsonify(get_dashboard_stats(days))
+
+@app.route('/admin/sales')
+@login_required
+def admin_sales():
+    """Sales grouped by item, category or hour over a date range"""
+    group = request.args.get('group', 'item')
+    date_from = parse_date(request.args.get('date_from')) or (datetime.utcnow() - timedelta(days=7))
+    date_to = parse_date(request.args.get('date_to'))
+    try:
+        return jsonify(get_sales(group, date_from, date_to))
+    except ValueError:
+        return jsonify({'error': f'Unknown grouping: {group}'}), 400
 
 @app.route('/set_language/<language>')
 def set_language(language):
-    if language in LANGUAGES:
+    if language in translations.catalogs:
         session['language'] = language
     return redirect(request.referrer or url_for('home'))
 
@@ -532,25 +852,20 @@ def update_restaurant_info():
     
     update_setting('restaurant_info', restaurant_info)
     
-    # Update global variable
-    global RESTAURANT_INFO
-    RESTAURANT_INFO = restaurant_info
-    
     flash('تم تحديث معلومات المطعم بنجاح', 'success')
     return redirect(url_for('admin_settings'))
 
 @app.route('/update_admin_credentials', methods=['POST'])
 @login_required
 def update_admin_credentials():
-    global ADMIN_USERNAME, ADMIN_PASSWORD
-    
     current_password = request.form['current_password']
     new_username = request.form['new_username']
     new_password = request.form['new_password']
     confirm_password = request.form['confirm_password']
     
     # Verify current password
-    if not check_admin_credentials(session.get('admin_username', ADMIN_USERNAME), current_password):
+    current_username = session.get('admin_username') or get_setting('admin_credentials', {}).get('username')
+    if not check_admin_credentials(current_username, current_password):
         flash('كلمة المرور الحالية غير صحيحة', 'error')
         return redirect(url_for('admin_settings'))
     
@@ -567,10 +882,6 @@ def update_admin_credentials():
     
     update_setting('admin_credentials', admin_credentials)
     
-    # Update global variables
-    ADMIN_USERNAME = new_username
-    ADMIN_PASSWORD = new_password
-    
     # Update session
     session['admin_username'] = new_username
     
@@ -602,6 +913,21 @@ def update_app_settings():
     
     return redirect(url_for('admin_settings'))
 
+@app.route('/update_delivery_zones', methods=['POST'])
+@login_required
+def update_delivery_zones():
+    """Save the delivery zones (JSON), validated before they are used"""
+    try:
+        delivery_config = json.loads(request.form.get('delivery_zones') or '{}')
+        delivery_zones.build(delivery_config)
+    except (TypeError, ValueError) as e:
+        flash(f'مناطق التوصيل غير صالحة: {e}', 'error')
+        return redirect(url_for('admin_settings'))
+    
+    update_setting(delivery_zones.SETTING_KEY, delivery_config)
+    flash('تم تحديث مناطق التوصيل بنجاح', 'success')
+    return redirect(url_for('admin_settings'))
+
 # في بداية الملف، أضف هذا:
 import os
 os.environ['SQLALCHEMY_SILENCE_UBER_WARNING'] = '1'
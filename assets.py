@@ -0,0 +1,122 @@
+"""Fingerprinted static assets with long-lived caching.
+
+At startup every static file outside the upload folder is hashed once and
+`url_for('static', filename=...)` transparently points at a fingerprinted
+name such as ``css/style.3f2a9c1d0b7e.css``. Those URLs, and uploads that are
+already named by content hash, are served with ``Cache-Control: immutable``.
+Text assets are precompressed (gzip, plus brotli when installed) so no
+request pays for compression.
+
+Files are sent through ``send_file``, which hands gunicorn a
+``wsgi.file_wrapper`` so the kernel copies them with sendfile().
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import request, send_file, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always built
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+ONE_YEAR = 365 * 24 * 3600
+
+# Uploads named by images.ImagePipeline: <16 hex chars>[-<width>].<ext>
+HASHED_UPLOAD = re.compile(r'^images/[0-9a-f]{16}(-\d+)?\.\w+$')
+
+
+class AssetManifest:
+    def __init__(self):
+        self.fingerprinted = {}  # original path -> fingerprinted path
+        self.originals = {}  # fingerprinted path -> original path
+        self.compressed = {}  # original path -> {encoding: file path}
+    
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.output_folder = os.path.join(app.instance_path, 'assets')
+        upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        self.build(exclude=upload_folder)
+        
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions['static'] = self.serve
+    
+    def build(self, exclude=None):
+        """Hash and precompress every static file, once per process start"""
+        for root, dirs, files in os.walk(self.static_folder):
+            if exclude and os.path.abspath(root).startswith(exclude):
+                continue
+            for name in files:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                
+                stem, extension = os.path.splitext(relative)
+                fingerprinted = f"{stem}.{digest}{extension}"
+                self.fingerprinted[relative] = fingerprinted
+                self.originals[fingerprinted] = relative
+                
+                if extension in COMPRESSIBLE:
+                    self.compressed[relative] = self.precompress(data, digest, extension)
+    
+    def precompress(self, data, digest, extension):
+        """Write gzip/brotli variants named by content hash, reusing earlier builds"""
+        os.makedirs(self.output_folder, exist_ok=True)
+        encoders = {'gzip': lambda raw: gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encoders['br'] = lambda raw: brotli.compress(raw, quality=11)
+        
+        variants = {}
+        for encoding, encode in encoders.items():
+            path = os.path.join(self.output_folder, f"{digest}{extension}.{encoding}")
+            if not os.path.exists(path):
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(encode(data))
+                os.replace(tmp_path, path)
+            variants[encoding] = path
+        return variants
+    
+    def fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.fingerprinted:
+            values['filename'] = self.fingerprinted[values['filename']]
+    
+    def serve(self, filename):
+        original = self.originals.get(filename)
+        immutable = original is not None or bool(HASHED_UPLOAD.match(filename))
+        original = original or filename
+        
+        response = self.send_compressed(original)
+        if response is None:
+            response = send_from_directory(self.static_folder, original,
+                                           max_age=ONE_YEAR if immutable else None)
+        if original in self.compressed:
+            response.vary.add('Accept-Encoding')
+        
+        if immutable:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = ONE_YEAR
+            response.cache_control.immutable = True
+        return response
+    
+    def send_compressed(self, filename):
+        variants = self.compressed.get(filename)
+        if not variants:
+            return None
+        for encoding in ('br', 'gzip'):
+            if encoding in variants and encoding in request.accept_encodings:
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_file(variants[encoding], mimetype=mimetype, conditional=True)
+                response.headers['Content-Encoding'] = encoding
+                return response
+        return None
+
+
+asset_manifest = AssetManifest()
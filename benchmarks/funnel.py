@@ -0,0 +1,397 @@
+"""Benchmark of the customer order funnel and the admin dashboard.
+
+Seeds a fresh SQLite database with --items menu items and --orders past
+orders. Each simulated customer then runs
+/menu -> /add_to_cart -> /checkout -> /place_order -> /track_order while an
+admin polls /admin and /get_order_stats. Latency percentiles per step and
+requests per second are reported.
+
+    python benchmarks/funnel.py                          # Flask test client
+    python benchmarks/funnel.py --mode gunicorn --users 8
+    python benchmarks/funnel.py --save-baseline          # store the numbers
+    python benchmarks/funnel.py --compare                # exit 1 on regression
+
+Baselines are kept per mode in benchmarks/baseline.json. They only compare
+runs made on the same machine with the same options.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+CATEGORIES = [
+    ('أطباق رئيسية', 'Plats Principaux'),
+    ('مقبلات', 'Entrées'),
+    ('حلويات', 'Desserts'),
+    ('مشروبات', 'Boissons'),
+]
+
+TRACKING_CODE = re.compile(r'track_order\?code=([A-Za-z0-9]+)')
+
+# Customer steps first, then the admin ones
+STEPS = ['menu', 'add_to_cart', 'checkout', 'place_order', 'track_order', 'admin', 'get_order_stats']
+
+
+def configure_environment(workdir):
+    """Point the app at the benchmark database (before `app` is imported)"""
+    os.environ.update({
+        'FLASK_ENV': 'production',
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'SECRET_KEY': 'benchmark',
+        'RUN_MIGRATIONS_ON_STARTUP': '0',
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'metrics'),
+    })
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def seed(app, items, orders, rng):
+    """Fill an empty database through the same helpers as the JSON migrations"""
+    from sqlalchemy import insert
+    from models import ORDER_STATUSES, db, MenuItem, Order
+    from database import (ensure_indexes, menu_item_row, order_row,
+                          backfill_order_items, update_setting)
+
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+
+        menu = []
+        for item_id in range(1, items + 1):
+            category, category_fr = CATEGORIES[item_id % len(CATEGORIES)]
+            menu.append(menu_item_row({
+                'id': item_id,
+                'name': f'طبق {item_id}',
+                'name_fr': f'Plat {item_id}',
+                'description': 'وصف الطبق',
+                'description_fr': 'Description du plat',
+                'price': float(rng.randrange(15, 150)),
+                'category': category,
+                'category_fr': category_fr,
+                'preparation_time': rng.randrange(5, 45),
+            }))
+        db.session.execute(insert(MenuItem), menu)
+
+        now = datetime.utcnow()
+        batch = []
+        for number in range(1, orders + 1):
+            lines = [{'id': item['id'], 'name': item['name'], 'price': item['price'],
+                      'quantity': rng.randrange(1, 4)}
+                     for item in rng.sample(menu, min(len(menu), rng.randrange(1, 4)))]
+            created_at = now - timedelta(minutes=rng.randrange(0, 90 * 24 * 60))
+            batch.append(order_row({
+                'tracking_code': f'B{number:07d}',
+                'customer_name': f'Client {number}',
+                'customer_phone': '0600000000',
+                'customer_address': 'Meknes',
+                'items': lines,
+                'total_amount': sum(line['price'] * line['quantity'] for line in lines),
+                'status': rng.choice(ORDER_STATUSES),
+                'created_at': created_at.isoformat(),
+            }))
+            if len(batch) == 5000:
+                db.session.execute(insert(Order), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Order), batch)
+        db.session.commit()
+        backfill_order_items(batch_size=5000)
+
+        update_setting('admin_credentials', {'username': 'admin', 'password': 'admin'})
+        update_setting('restaurant_info', {
+            'name': 'فودي', 'name_fr': 'Foodie', 'phone': '0600000000',
+            'location': {'ar': 'مكناس', 'fr': 'Meknes'},
+        })
+        update_setting('app_settings', {
+            'currency': 'د.م', 'currency_fr': 'MAD', 'tax_rate': 0,
+            'delivery_fee': 0, 'min_order_amount': 0,
+        })
+
+
+class TestClientSession:
+    """One visitor driving the app in-process through Flask's test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data(as_text=True)
+
+    def post(self, path, data):
+        response = self.client.post(path, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    """One visitor with its own cookies, talking to a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=30) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace')
+
+    def get(self, path):
+        return self.request(path)
+
+    def post(self, path, data):
+        return self.request(path, data)
+
+
+class Recorder:
+    """Latency samples and failures per funnel step"""
+
+    def __init__(self):
+        self.samples = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self._lock = threading.Lock()
+
+    def call(self, step, func, *args):
+        started = time.perf_counter()
+        try:
+            status, body = func(*args)
+        except OSError:
+            status, body = 599, ''
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples[step].append(elapsed)
+            if status >= 400:
+                self.errors[step] += 1
+        return status, body
+
+
+def run_customer(session, recorder, iterations, item_ids, rng):
+    for number in range(iterations):
+        recorder.call('menu', session.get, '/menu')
+        for item_id in rng.sample(item_ids, min(len(item_ids), 2)):
+            recorder.call('add_to_cart', session.post, '/add_to_cart',
+                          {'item_id': item_id, 'quantity': rng.randrange(1, 3)})
+        recorder.call('checkout', session.get, '/checkout')
+        status, body = recorder.call('place_order', session.post, '/place_order', {
+            'customer_name': f'Bench {number}',
+            'customer_phone': '0611111111',
+            'customer_address': 'Meknes',
+        })
+        match = TRACKING_CODE.search(body)
+        if match:
+            recorder.call('track_order', session.get, f'/track_order?code={match.group(1)}')
+
+
+def run_admin(session, recorder, stop, interval):
+    session.post('/admin/login', {'username': 'admin', 'password': 'admin'})
+    while not stop.is_set():
+        recorder.call('admin', session.get, '/admin')
+        recorder.call('get_order_stats', session.get, '/get_order_stats?days=30')
+        stop.wait(interval)
+
+
+def run_load(make_session, args, item_ids):
+    """Run the customers and the polling admin; return the recorder and wall time"""
+    recorder = Recorder()
+    stop = threading.Event()
+    admin = threading.Thread(target=run_admin,
+                             args=(make_session(), recorder, stop, args.admin_interval))
+
+    started = time.perf_counter()
+    admin.start()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [pool.submit(run_customer, make_session(), recorder, args.iterations,
+                               item_ids, random.Random(args.seed + user))
+                   for user in range(args.users)]
+        for future in futures:
+            future.result()
+    stop.set()
+    admin.join()
+    return recorder, time.perf_counter() - started
+
+
+def percentile(samples, quantile):
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    return statistics.quantiles(ordered, n=100, method='inclusive')[quantile - 1]
+
+
+def summarize(recorder, duration, args):
+    steps = {}
+    for step, samples in recorder.samples.items():
+        if samples:
+            steps[step] = {
+                'count': len(samples),
+                'errors': recorder.errors[step],
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                'p99_ms': round(percentile(samples, 99) * 1000, 2),
+            }
+    total = sum(len(samples) for samples in recorder.samples.values())
+    return {
+        'mode': args.mode,
+        'options': {'items': args.items, 'orders': args.orders, 'users': args.users,
+                    'iterations': args.iterations, 'workers': args.workers},
+        'requests': total,
+        'errors': sum(recorder.errors.values()),
+        'duration_s': round(duration, 3),
+        'requests_per_second': round(total / duration, 1) if duration else 0,
+        'steps': steps,
+    }
+
+
+def print_report(report):
+    print(f"\n{report['mode']}: {report['requests']} requests in {report['duration_s']}s "
+          f"({report['requests_per_second']} req/s, {report['errors']} errors)")
+    print(f"{'step':<18}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, stats in report['steps'].items():
+        print(f"{step:<18}{stats['count']:>7}{stats['errors']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def compare(report, baseline, tolerance, noise_ms):
+    """List the regressions of `report` against `baseline`"""
+    problems = []
+    if report['options'] != baseline['options']:
+        problems.append(f"options differ from the baseline: {baseline['options']}")
+    if report['errors']:
+        problems.append(f"{report['errors']} failed requests")
+
+    floor = baseline['requests_per_second'] * (1 - tolerance)
+    if report['requests_per_second'] < floor:
+        problems.append(f"throughput {report['requests_per_second']} req/s "
+                        f"< {baseline['requests_per_second']} req/s baseline")
+
+    for step, base in baseline['steps'].items():
+        current = report['steps'].get(step)
+        if current is None:
+            problems.append(f"{step}: no samples")
+            continue
+        limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + noise_ms)
+        if current['p95_ms'] > limit:
+            problems.append(f"{step}: p95 {current['p95_ms']} ms > {base['p95_ms']} ms baseline")
+    return problems
+
+
+def start_gunicorn(port, workers):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py',
+         '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/track_order', timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=4, help='concurrent customers')
+    parser.add_argument('--iterations', type=int, default=20, help='orders per customer')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--admin-interval', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help='where the database is created (default: a temp dir)')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help='fail on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown, as a fraction of the baseline')
+    parser.add_argument('--noise-ms', type=float, default=2.0,
+                        help='p95 increases below this are ignored')
+    parser.add_argument('--output', help='also write the report as JSON')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='foodie-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    database = os.path.join(workdir, 'bench.db')
+    if os.path.exists(database):
+        os.remove(database)
+    configure_environment(workdir)
+
+    from app import app
+
+    started = time.perf_counter()
+    seed(app, args.items, args.orders, random.Random(args.seed))
+    print(f"Seeded {args.items} menu items and {args.orders} orders "
+          f"in {time.perf_counter() - started:.1f}s ({database})")
+    item_ids = list(range(1, args.items + 1))
+
+    if args.mode == 'client':
+        recorder, duration = run_load(lambda: TestClientSession(app), args, item_ids)
+    else:
+        server = start_gunicorn(args.port, args.workers)
+        try:
+            base_url = f'http://127.0.0.1:{args.port}'
+            recorder, duration = run_load(lambda: HTTPSession(base_url), args, item_ids)
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = summarize(recorder, duration, args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[args.mode] = report
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False)
+        print(f"Baseline saved to {BASELINE_FILE}")
+    elif args.compare:
+        if args.mode not in baselines:
+            print(f"No {args.mode} baseline in {BASELINE_FILE}; run with --save-baseline first")
+            return 2
+        problems = compare(report, baselines[args.mode], args.tolerance, args.noise_ms)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            return 1
+        print("No regression against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Small thread-safe in-process caches with hit/miss accounting."""
+import threading
+import time
+from collections import OrderedDict
+
+# Every named cache, so hit rates can be reported in one place
+CACHES = {}
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache whose entries expire `ttl` seconds after being stored"""
+    
+    def __init__(self, name, ttl, maxsize=1024):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._fill_locks = {}
+        CACHES[name] = self
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def get_or_set(self, key, factory):
+        """Get a cached value or compute, store and return it.
+
+        Concurrent misses for the same key wait for a single computation.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        
+        with self._lock:
+            fill_lock = self._fill_locks.setdefault(key, threading.Lock())
+        with fill_lock:
+            value = self._peek(key)
+            if value is _MISSING:
+                value = factory()
+                self.set(key, value)
+        with self._lock:
+            self._fill_locks.pop(key, None)
+        return value
+    
+    def _peek(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            return _MISSING
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,131 @@
+"""Server-side shopping carts.
+
+The session cookie only holds a random cart id, so its size stays constant
+however many items are added. Cart lines are a dict of menu item id to
+quantity; names and prices always come from the menu catalog when the cart
+is displayed or ordered, never from what was stored when the item was added.
+"""
+import json
+import secrets
+from datetime import datetime, timedelta
+
+from cache import TTLCache
+from models import db, ShoppingCart
+
+
+class Cart:
+    def __init__(self, id=None, lines=None, version=0):
+        self.id = id or secrets.token_urlsafe(16)
+        self.lines = dict(lines or {})
+        self.version = version
+    
+    def add(self, item_id, quantity):
+        if quantity < 1:
+            raise ValueError(f"Invalid quantity: {quantity}")
+        self.lines[item_id] = self.lines.get(item_id, 0) + quantity
+    
+    def set_quantity(self, item_id, quantity):
+        if quantity > 0:
+            self.lines[item_id] = quantity
+        else:
+            self.lines.pop(item_id, None)
+    
+    def __len__(self):
+        return len(self.lines)
+    
+    def priced_lines(self, catalog):
+        """Cart lines priced against the catalog, skipping items no longer sold"""
+        lines = []
+        for item_id, quantity in self.lines.items():
+            item = catalog.get_item(item_id)
+            if item is None or not item['available']:
+                continue
+            lines.append({
+                'id': item_id,
+                'name': item['name'],
+                'price': item['price'],
+                'quantity': quantity,
+                'image': item['image']
+            })
+        return lines
+    
+    def encode_lines(self):
+        # JSON object keys are strings
+        return json.dumps({str(item_id): quantity for item_id, quantity in self.lines.items()})
+    
+    @staticmethod
+    def decode_lines(raw):
+        return {int(item_id): quantity for item_id, quantity in json.loads(raw or '{}').items()}
+
+
+class MemoryCartStore:
+    """Carts kept in this process only; for development or a single worker"""
+    
+    def __init__(self, ttl):
+        self._carts = TTLCache('carts', ttl=ttl, maxsize=100000)
+    
+    def load(self, cart_id):
+        raw = self._carts.get(cart_id)
+        if raw is None:
+            return None
+        version, lines = raw
+        return Cart(cart_id, Cart.decode_lines(lines), version)
+    
+    def save(self, cart):
+        cart.version += 1
+        self._carts.set(cart.id, (cart.version, cart.encode_lines()))
+    
+    def delete(self, cart):
+        self._carts.delete(cart.id)
+
+
+class DatabaseCartStore:
+    """Carts in the carts table, shared by every worker"""
+    
+    def __init__(self, ttl):
+        self.ttl = timedelta(seconds=ttl)
+        self._saves = 0
+    
+    def load(self, cart_id):
+        record = db.session.get(ShoppingCart, cart_id)
+        if record is None or record.updated_at < datetime.utcnow() - self.ttl:
+            return None
+        return Cart(record.id, Cart.decode_lines(record.lines), record.version)
+    
+    def save(self, cart):
+        cart.version += 1
+        record = db.session.get(ShoppingCart, cart.id)
+        if record is None:
+            record = ShoppingCart(id=cart.id)
+            db.session.add(record)
+        record.lines = cart.encode_lines()
+        record.version = cart.version
+        record.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        self._saves += 1
+        if self._saves % 500 == 0:
+            self.prune()
+    
+    def delete(self, cart):
+        ShoppingCart.query.filter_by(id=cart.id).delete()
+        db.session.commit()
+    
+    def prune(self):
+        """Delete carts abandoned for longer than the TTL"""
+        cutoff = datetime.utcnow() - self.ttl
+        ShoppingCart.query.filter(ShoppingCart.updated_at < cutoff).delete()
+        db.session.commit()
+
+
+CART_STORES = {
+    'memory': MemoryCartStore,
+    'database': DatabaseCartStore,
+}
+
+
+def init_cart_store(app):
+    store_class = CART_STORES[app.config.get('CART_BACKEND', 'memory')]
+    store = store_class(ttl=app.config.get('CART_TTL_SECONDS', 7 * 24 * 3600))
+    app.extensions['cart_store'] = store
+    return store
@@ -0,0 +1,105 @@
+"""In-memory menu catalog shared by the customer-facing pages.
+
+The menu changes a few times a day but is read on every page view, so each
+worker keeps a decoded snapshot and only reloads it when the shared 'menu'
+version counter in the database moves. Per-language views of a snapshot
+(item texts from the `_fr`, ... columns) are built once and kept with it.
+"""
+import threading
+import time
+
+from database import get_cache_version, bump_cache_version
+from models import MenuItem
+
+FEATURED_COUNT = 6
+
+# Item texts stored per language as `<field>_<language>` (e.g. name_fr)
+LOCALIZED_FIELDS = ('name', 'description', 'category', 'ingredients')
+
+
+def localize_item(item, language):
+    """Copy of an item with its texts in `language`, falling back to the default"""
+    localized = dict(item)
+    for field in LOCALIZED_FIELDS:
+        localized[field] = item.get(f'{field}_{language}') or item[field]
+    return localized
+
+
+class CatalogSnapshot:
+    """Decoded, immutable view of the menu at one catalog version"""
+    
+    def __init__(self, version, items, language=None):
+        self.version = version
+        self.language = language
+        self.loaded_at = time.time()
+        
+        # Categories are keyed (in URLs, orders and stats) by their default
+        # language name, whatever language the items are shown in
+        for item in items:
+            item.setdefault('category_key', item['category'])
+        self.items = {item['id']: item for item in items}
+        self.category_of = {item['id']: item['category_key'] for item in items}
+        self.available = [item for item in items if item['available']]
+        self.featured = self.available[:FEATURED_COUNT]
+        
+        # Categories keep the menu order of their first available item
+        self.by_category = {}
+        for item in self.available:
+            self.by_category.setdefault(item['category_key'], []).append(item)
+        self.categories = list(self.by_category)
+        self.category_labels = {key: items[0]['category'] for key, items in self.by_category.items()}
+        self._localized = {}
+    
+    def localized(self, language):
+        """This snapshot with item texts in `language`, built on first use"""
+        view = self._localized.get(language)
+        if view is None:
+            items = [localize_item(item, language) for item in self.items.values()]
+            view = self._localized.setdefault(language, CatalogSnapshot(self.version, items, language))
+        return view
+    
+    def get_item(self, item_id):
+        return self.items.get(item_id)
+    
+    def get_category(self, category):
+        return self.by_category.get(category, [])
+
+
+class MenuCatalog:
+    VERSION_KEY = 'menu'
+    
+    def __init__(self, revalidate_seconds=1.0):
+        self.revalidate_seconds = revalidate_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.revalidate_seconds = app.config.get('CATALOG_REVALIDATE_SECONDS', self.revalidate_seconds)
+    
+    def get(self):
+        """Get the current snapshot, reloading it if another worker changed the menu"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.revalidate_seconds:
+            return snapshot
+        
+        with self._lock:
+            # Another thread may have revalidated while we waited
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.revalidate_seconds:
+                return self._snapshot
+            
+            version = get_cache_version(self.VERSION_KEY)
+            if self._snapshot is None or self._snapshot.version != version:
+                items = MenuItem.query.order_by(MenuItem.id).all()
+                self._snapshot = CatalogSnapshot(version, [item.to_dict() for item in items])
+            self._checked_at = time.monotonic()
+            return self._snapshot
+    
+    def touch(self):
+        """Mark the menu as changed; call before committing a menu write"""
+        bump_cache_version(self.VERSION_KEY)
+        # Revalidate on the next read instead of waiting for the interval
+        self._checked_at = 0.0
+
+
+menu_catalog = MenuCatalog()
@@ -0,0 +1,60 @@
+"""Maintenance commands, run with `flask --app app <command>`."""
+import click
+
+from database import backfill_order_items, init_database
+from transfer import export_menu, export_orders, import_menu, import_orders
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create tables and apply pending JSON data migrations."""
+        try:
+            init_database(app, raise_errors=True)
+        except Exception as e:
+            # A non-zero exit stops the deploy instead of starting on a broken schema
+            raise click.ClickException(f"Database initialization failed: {e}")
+    
+    @app.cli.command('backfill-order-items')
+    @click.option('--batch-size', default=500, show_default=True,
+                  help='Orders read and committed per batch.')
+    def backfill_order_items_command(batch_size):
+        """Populate order_items for orders placed before it existed."""
+        orders, rows = backfill_order_items(batch_size=batch_size)
+        click.echo(f"Backfilled {rows} line items for {orders} orders")
+
+    @app.cli.command('export-orders')
+    @click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def export_orders_command(output, batch_size):
+        """Stream all orders to OUTPUT as NDJSON ('-' for stdout)."""
+        progress = export_orders(output, batch_size=batch_size)
+        click.echo(progress.summary(), err=True)
+    
+    @app.cli.command('export-menu')
+    @click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+    def export_menu_command(output):
+        """Write the menu to OUTPUT as NDJSON ('-' for stdout)."""
+        progress = export_menu(output)
+        click.echo(progress.summary(), err=True)
+    
+    @app.cli.command('import-orders')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--batch-size', default=1000, show_default=True,
+                  help='Orders inserted and committed per batch.')
+    @click.option('--resume-from', default=0, show_default=True,
+                  help='Skip this many lines (the last reported line offset).')
+    def import_orders_command(source, batch_size, resume_from):
+        """Stream orders from an NDJSON file into the database."""
+        progress = import_orders(source, batch_size=batch_size, resume_from=resume_from)
+        click.echo(progress.summary(), err=True)
+    
+    @app.cli.command('import-menu')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--batch-size', default=500, show_default=True)
+    @click.option('--resume-from', default=0, show_default=True,
+                  help='Skip this many lines (the last reported line offset).')
+    def import_menu_command(source, batch_size, resume_from):
+        """Stream menu items from an NDJSON file into the database."""
+        progress = import_menu(source, batch_size=batch_size, resume_from=resume_from)
+        click.echo(progress.summary(), err=True)
@@ -1,6 +1,33 @@
 import os
 from urllib.parse import urlparse
 
+# Concurrency profile shared with gunicorn_config.py: each worker process runs
+# WORKER_THREADS request threads (gthread) or greenlets (gevent)
+WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+# Background job threads per worker process (see jobs.py)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+if WORKER_CLASS == 'gevent':
+    # Greenlets are cheap; cap the connections they may hold per worker
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+else:
+    # One connection per request thread, plus background threads (order
+    # event poller, job workers) so they never wait for a request to finish
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', WORKER_THREADS + 1 + JOB_WORKERS))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+
+# Connections all gunicorn workers together may hold: gunicorn_config.py runs
+# no more workers than fit (DB_POOL_SIZE + DB_MAX_OVERFLOW each). Keep it below
+# the server's max_connections, leaving room for `flask init-db` and psql.
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 80))
+
+# Admin event streams (SSE) each hold a thread for EVENT_STREAM_MAX_SECONDS.
+# gthread workers get this many threads on top of WORKER_THREADS and refuse
+# further streams, so streams never take the threads customers are served on.
+# Streams use no database connection.
+EVENT_STREAM_THREADS = int(os.environ.get('EVENT_STREAM_THREADS', 2))
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
     
@@ -11,14 +38,117 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///foodie.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # pool_recycle already retires connections before the server drops them,
+    # so the per-checkout ping round trip is opt-in. A short pool_timeout
+    # makes pool starvation fail fast instead of stalling the worker.
     SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_pre_ping': True,
-        'pool_recycle': 300,
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '0') == '1',
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
     }
     
+    # Per-request query count, SQL time and pool wait.
+    # Sent as X-DB-* / Server-Timing headers when DB_STATS_HEADERS is on,
+    # and requests above these limits are logged.
+    DB_STATS_HEADERS = os.environ.get('DB_STATS_HEADERS', '1') == '1'
+    DB_WARN_QUERIES = int(os.environ.get('DB_WARN_QUERIES', 25))
+    DB_WARN_POOL_WAIT_MS = float(os.environ.get('DB_WARN_POOL_WAIT_MS', 100))
+    
+    # Bearer token required by /metrics when set. With METRICS_TOKEN_REQUIRED
+    # (the default in production) /metrics is not served without a token.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_TOKEN_REQUIRED = os.environ.get('METRICS_TOKEN_REQUIRED', '0') == '1'
+    
+    # SQLite: milliseconds a writer waits for the file lock before "database
+    # is locked", and the fsync level (FULL keeps every commit durable)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'FULL')
+    
+    # Order placement: 'direct' commits each order in its own request; 'batch'
+    # groups the orders placed at the same time in a worker into one commit,
+    # waiting at most ORDER_BATCH_WAIT_MS for a batch to fill. A request waits
+    # ORDER_COMMIT_TIMEOUT for its batch, then sends the customer to the
+    # tracking page of the order, which may still be stored.
+    ORDER_COMMIT_MODE = os.environ.get('ORDER_COMMIT_MODE', 'direct')
+    ORDER_BATCH_SIZE = int(os.environ.get('ORDER_BATCH_SIZE', 20))
+    ORDER_BATCH_WAIT_MS = float(os.environ.get('ORDER_BATCH_WAIT_MS', 20))
+    ORDER_COMMIT_TIMEOUT = float(os.environ.get('ORDER_COMMIT_TIMEOUT', 10))
+    
+    # Create tables and run the JSON data migrations when the app is created.
+    # Production runs them once per deploy with `flask init-db` instead.
+    RUN_MIGRATIONS_ON_STARTUP = os.environ.get('RUN_MIGRATIONS_ON_STARTUP', '1') == '1'
+    
     # Upload configuration
     UPLOAD_FOLDER = 'static/images'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    IMAGE_VARIANT_WIDTHS = (320, 640, 1024)  # responsive widths generated per upload
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    
+    # Admin dashboard
+    ADMIN_ORDERS_PER_PAGE = int(os.environ.get('ADMIN_ORDERS_PER_PAGE', 50))
+    STATS_CACHE_SECONDS = int(os.environ.get('STATS_CACHE_SECONDS', 10))
+    
+    # Order tracking API: seconds another worker may serve a stale status
+    TRACKING_CACHE_SECONDS = int(os.environ.get('TRACKING_CACHE_SECONDS', 5))
+    
+    # Cart price quotes, reused from checkout to order placement; a quote is
+    # also keyed by cart, menu and settings versions, so this only bounds memory
+    QUOTE_CACHE_SECONDS = int(os.environ.get('QUOTE_CACHE_SECONDS', 600))
+    
+    # Kitchen ETA: parallel stations (cooks), minutes per extra portion on top
+    # of an order's longest dish, and how often workers fully reload the queue
+    KITCHEN_STATIONS = int(os.environ.get('KITCHEN_STATIONS', 2))
+    KITCHEN_EXTRA_ITEM_MINUTES = float(os.environ.get('KITCHEN_EXTRA_ITEM_MINUTES', 2))
+    KITCHEN_DEFAULT_PREP_MINUTES = int(os.environ.get('KITCHEN_DEFAULT_PREP_MINUTES', 15))
+    KITCHEN_RESYNC_SECONDS = int(os.environ.get('KITCHEN_RESYNC_SECONDS', 60))
+    
+    # Delivery zones: grid cell size of the zone lookup (0.01° is about 1 km)
+    # and the most cells it may use (zones covering more are refused), and
+    # the size of the driver routes grouped from waiting orders
+    DELIVERY_GRID_CELL_DEGREES = float(os.environ.get('DELIVERY_GRID_CELL_DEGREES', 0.01))
+    DELIVERY_GRID_MAX_CELLS = int(os.environ.get('DELIVERY_GRID_MAX_CELLS', 100000))
+    DELIVERY_ROUTE_MAX_STOPS = int(os.environ.get('DELIVERY_ROUTE_MAX_STOPS', 5))
+    DELIVERY_ROUTE_RADIUS_KM = float(os.environ.get('DELIVERY_ROUTE_RADIUS_KM', 2.0))
+    
+    # Memory budget of the rendered home/menu page cache, per worker
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    
+    # Seconds a worker trusts its cached menu before checking the shared version
+    CATALOG_REVALIDATE_SECONDS = float(os.environ.get('CATALOG_REVALIDATE_SECONDS', 1.0))
+    
+    # Server-side carts: 'memory' for a single worker, 'database' otherwise
+    CART_BACKEND = os.environ.get('CART_BACKEND', 'memory')
+    CART_TTL_SECONDS = int(os.environ.get('CART_TTL_SECONDS', 7 * 24 * 3600))
+    
+    # Background jobs: worker threads per process, retries with exponential
+    # backoff, and how long a job may run before it is considered abandoned
+    JOB_WORKERS = JOB_WORKERS
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2.0))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', 10))
+    JOB_MAX_BACKOFF_SECONDS = float(os.environ.get('JOB_MAX_BACKOFF_SECONDS', 3600))
+    JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 300))
+    JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 24 * 3600))
+    
+    # Customer notifications: 'log', 'fake', 'twilio' or 'webhook'
+    NOTIFICATION_BACKEND = os.environ.get('NOTIFICATION_BACKEND', 'log')
+    NOTIFICATION_COUNTRY_CODE = os.environ.get('NOTIFICATION_COUNTRY_CODE', '212')
+    NOTIFICATION_WEBHOOK_URL = os.environ.get('NOTIFICATION_WEBHOOK_URL')
+    TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
+    TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
+    TWILIO_FROM_NUMBER = os.environ.get('TWILIO_FROM_NUMBER')
+    
+    # Live order stream (Server-Sent Events)
+    # 'memory' for a single worker, 'database' to fan out across workers
+    EVENT_BROKER = os.environ.get('EVENT_BROKER', 'memory')
+    EVENT_POLL_INTERVAL = float(os.environ.get('EVENT_POLL_INTERVAL', 0.5))
+    # Seconds recent events are polled again, for ids that commit out of order
+    EVENT_POLL_LOOKBACK_SECONDS = float(os.environ.get('EVENT_POLL_LOOKBACK_SECONDS', 10))
+    EVENT_STREAM_MAX_SECONDS = int(os.environ.get('EVENT_STREAM_MAX_SECONDS', 300))
+    # Concurrent streams per worker (None: unlimited, as gevent streams are cheap)
+    EVENT_STREAM_MAX_CLIENTS = EVENT_STREAM_THREADS if WORKER_CLASS == 'gthread' else None
     
     # Render specific settings
     PORT = int(os.environ.get('PORT', 5000))
@@ -31,6 +161,11 @@ class DevelopmentConfig(Config):
 
 class ProductionConfig(Config):
     DEBUG = False
+    RUN_MIGRATIONS_ON_STARTUP = os.environ.get('RUN_MIGRATIONS_ON_STARTUP', '0') == '1'
+    EVENT_BROKER = os.environ.get('EVENT_BROKER', 'database')
+    CART_BACKEND = os.environ.get('CART_BACKEND', 'database')
+    DB_STATS_HEADERS = os.environ.get('DB_STATS_HEADERS', '0') == '1'
+    METRICS_TOKEN_REQUIRED = os.environ.get('METRICS_TOKEN_REQUIRED', '1') == '1'
 
 config = {
     'development': DevelopmentConfig,
@@ -1,31 +1,38 @@
+import base64
 import json
 import os
-from models import db, MenuItem, Order, Settings
-from datetime import datetime
-import uuid
+import secrets
+import time
+from models import db, MenuItem, Order, OrderItem, Settings, CacheVersion, SchemaMigration
+from cache import TTLCache
+from datetime import datetime, timedelta
+from sqlalchemy import and_, event, func, insert, inspect, or_, text
+from sqlalchemy.exc import IntegrityError
 
-def init_database(app):
-    """Initialize database and migrate data from JSON files if needed"""
+def init_database(app, raise_errors=False):
+    """Initialize database and migrate data from JSON files if needed.
+    
+    At app startup errors are logged and the app still starts; `flask init-db`
+    passes raise_errors so a failed release step exits non-zero.
+    """
     try:
         with app.app_context():
+            started = time.perf_counter()
+            
             # Create tables
             db.create_all()
-            print("Database tables created successfully")
-            
-            # Check if data already exists before migrating
-            if MenuItem.query.first() is None:
-                migrate_menu_data()
+            ensure_columns()
+            ensure_indexes()
+            print(f"Database tables created successfully in {time.perf_counter() - started:.2f}s")
             
-            if Settings.query.first() is None:
-                migrate_settings_data()
+            run_data_migrations()
             
-            # Migrate orders if any exist in JSON
-            migrate_orders_data()
-            
-            print("Data migration completed")
+            print(f"Data migration completed in {time.perf_counter() - started:.2f}s")
             
     except Exception as e:
         print(f"Database initialization error: {e}")
+        if raise_errors:
+            raise
         # Create basic structure if migration fails
         try:
             with app.app_context():
@@ -34,76 +41,211 @@ def init_database(app):
         except Exception as inner_e:
             print(f"Critical database error: {inner_e}")
 
-def migrate_menu_data():
-    """Migrate menu data from JSON to database"""
-    menu_file = os.path.join('data', 'menu.json')
-    if os.path.exists(menu_file):
-        with open(menu_file, 'r', encoding='utf-8') as f:
-            menu_data = json.load(f)
+def configure_sqlite(app):
+    """Use WAL and wait for locks on SQLite, so readers and writers overlap"""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    busy_timeout = int(app.config['SQLITE_BUSY_TIMEOUT_MS'])
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {synchronous}")
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.close()
+
+def run_data_migrations():
+    """Run each JSON data migration once, recording it in schema_migrations"""
+    applied = {name for (name,) in db.session.query(SchemaMigration.name)}
+    
+    for name, migrate in DATA_MIGRATIONS:
+        if name in applied:
+            continue
         
-        for item_data in menu_data:
-            # تصحيح التعامل مع التاريخ
-            created_at_str = item_data.get('created_at')
-            if created_at_str:
-                try:
-                    created_at = datetime.fromisoformat(created_at_str)
-                except ValueError:
-                    created_at = datetime.utcnow()
-            else:
-                created_at = datetime.utcnow()
-            
-            menu_item = MenuItem(
-                id=item_data.get('id'),
-                name=item_data.get('name'),
-                name_fr=item_data.get('name_fr'),
-                description=item_data.get('description'),
-                description_fr=item_data.get('description_fr'),
-                price=item_data.get('price'),
-                category=item_data.get('category'),
-                category_fr=item_data.get('category_fr'),
-                image=item_data.get('image'),
-                available=item_data.get('available', True),
-                preparation_time=item_data.get('preparation_time', 15),
-                ingredients=json.dumps(item_data.get('ingredients', []), ensure_ascii=False),
-                ingredients_fr=json.dumps(item_data.get('ingredients_fr', []), ensure_ascii=False),
-                created_at=created_at
-            )
-            db.session.add(menu_item)
+        started = time.perf_counter()
+        count = migrate()
+        elapsed = time.perf_counter() - started
         
+        db.session.add(SchemaMigration(name=name, details=f"{count} rows in {elapsed:.2f}s"))
         db.session.commit()
-        print(f"Migrated {len(menu_data)} menu items to database")
+        print(f"Migration {name}: {count} rows in {elapsed:.2f}s")
+
+def ensure_columns():
+    """Add model columns missing from tables that predate them"""
+    # create_all() never alters existing tables. Only nullable columns
+    # without a server default are added this way.
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} "
+                                        f"ADD COLUMN {preparer.format_column(column)} {column_type}"))
+            print(f"Added column {table.name}.{column.name}")
+
+def ensure_indexes():
+    """Create model indexes missing from tables that predate them"""
+    # create_all() only creates indexes together with new tables
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def parse_datetime(value, default=None):
+    """Parse an ISO date from the JSON files, falling back to `default`"""
+    if value:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            pass
+    return default or datetime.utcnow()
+
+def parse_coordinate(value):
+    """Latitude or longitude from the JSON files (stored there as strings)"""
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def parse_amount(value):
+    """Optional amount or distance of an order (None when it was not recorded)"""
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def menu_item_row(item_data):
+    """Map a menu item from the JSON files to menu_items column values"""
+    return {
+        'id': item_data.get('id'),
+        'name': item_data.get('name'),
+        'name_fr': item_data.get('name_fr'),
+        'description': item_data.get('description'),
+        'description_fr': item_data.get('description_fr'),
+        'price': item_data.get('price'),
+        'category': item_data.get('category'),
+        'category_fr': item_data.get('category_fr'),
+        'image': item_data.get('image'),
+        'available': item_data.get('available', True),
+        'preparation_time': item_data.get('preparation_time', 15),
+        'ingredients': json.dumps(item_data.get('ingredients', []), ensure_ascii=False),
+        'ingredients_fr': json.dumps(item_data.get('ingredients_fr', []), ensure_ascii=False),
+        'created_at': parse_datetime(item_data.get('created_at'))
+    }
+
+def order_row(order_data):
+    """Map an order from the JSON files to orders column values"""
+    tracking_code = order_data.get('tracking_code') or order_data.get('order_number') or generate_tracking_code()
+    created_at = parse_datetime(order_data.get('created_at'))
+    return {
+        'tracking_code': tracking_code,
+        'customer_name': order_data.get('customer_name'),
+        'customer_phone': order_data.get('customer_phone'),
+        'customer_address': order_data.get('customer_address'),
+        'items': json.dumps(order_data.get('items', []), ensure_ascii=False),
+        'total_amount': order_data.get('total_amount') or order_data.get('total'),
+        'status': order_data.get('status', 'جديد'),
+        'notes': order_data.get('notes', ''),
+        'latitude': parse_coordinate(order_data.get('latitude')),
+        'longitude': parse_coordinate(order_data.get('longitude')),
+        'customer_location': order_data.get('customer_location'),
+        'delivery_zone': order_data.get('delivery_zone'),
+        'delivery_distance_km': parse_amount(order_data.get('delivery_distance_km')),
+        'delivery_fee': parse_amount(order_data.get('delivery_fee')),
+        'discount_amount': parse_amount(order_data.get('discount_amount')),
+        'tax_amount': parse_amount(order_data.get('tax_amount')),
+        'created_at': created_at,
+        'updated_at': parse_datetime(order_data.get('updated_at'), created_at)
+    }
+
+def migrate_menu_data():
+    """Migrate menu data from JSON to database"""
+    # Never re-seed a menu that is already managed from the admin panel
+    if MenuItem.query.first() is not None:
+        return 0
+    
+    menu_file = os.path.join('data', 'menu.json')
+    if not os.path.exists(menu_file):
+        return 0
+    
+    with open(menu_file, 'r', encoding='utf-8') as f:
+        menu_data = json.load(f)
+    
+    rows = [menu_item_row(item_data) for item_data in menu_data]
+    if rows:
+        db.session.execute(insert(MenuItem), rows)
+    db.session.commit()
+    print(f"Migrated {len(rows)} menu items to database")
+    return len(rows)
 
 def migrate_orders_data():
     """Migrate orders data from JSON to database"""
     orders_file = os.path.join('data', 'orders.json')
-    if os.path.exists(orders_file):
-        with open(orders_file, 'r', encoding='utf-8') as f:
-            orders_data = json.load(f)
-        
-        for order_data in orders_data:
-            # Check if order already exists
-            tracking_code = order_data.get('tracking_code') or order_data.get('order_number') or str(uuid.uuid4())[:8].upper()
-            existing_order = Order.query.filter_by(tracking_code=tracking_code).first()
-            if not existing_order:
-                order = Order(
-                    tracking_code=tracking_code,
-                    customer_name=order_data.get('customer_name'),
-                    customer_phone=order_data.get('customer_phone'),
-                    customer_address=order_data.get('customer_address'),
-                    items=json.dumps(order_data.get('items', []), ensure_ascii=False),
-                    total_amount=order_data.get('total_amount') or order_data.get('total'),
-                    status=order_data.get('status', 'جديد'),
-                    notes=order_data.get('notes', ''),
-                    created_at=datetime.fromisoformat(order_data.get('created_at', datetime.utcnow().isoformat())),
-                    updated_at=datetime.fromisoformat(order_data.get('updated_at', order_data.get('created_at', datetime.utcnow().isoformat())))
-                )
-                db.session.add(order)
-        
-        db.session.commit()
-        print(f"Migrated {len(orders_data)} orders to database")
+    if not os.path.exists(orders_file):
+        return 0
+    
+    with open(orders_file, 'r', encoding='utf-8') as f:
+        orders_data = json.load(f)
+    
+    rows = [order_row(order_data) for order_data in orders_data]
+    
+    # One query for the orders already in the database instead of one per order
+    codes = [row['tracking_code'] for row in rows]
+    existing = {code for (code,) in db.session.query(Order.tracking_code).filter(Order.tracking_code.in_(codes))}
+    
+    new_rows = []
+    for row in rows:
+        if row['tracking_code'] not in existing:
+            existing.add(row['tracking_code'])
+            new_rows.append(row)
+    
+    if new_rows:
+        db.session.execute(insert(Order), new_rows)
+    db.session.commit()
+    backfill_order_items()
+    
+    print(f"Migrated {len(new_rows)} of {len(rows)} orders to database")
+    return len(new_rows)
+
+def migrate_order_positions():
+    """Copy delivery positions of JSON orders migrated before they were stored"""
+    orders_file = os.path.join('data', 'orders.json')
+    if not os.path.exists(orders_file):
+        return 0
+    
+    with open(orders_file, 'r', encoding='utf-8') as f:
+        orders_data = json.load(f)
+    
+    updated = 0
+    for row in map(order_row, orders_data):
+        if row['latitude'] is None or row['longitude'] is None:
+            continue
+        updated += (Order.query
+                    .filter(Order.tracking_code == row['tracking_code'], Order.latitude.is_(None))
+                    .update({Order.latitude: row['latitude'],
+                             Order.longitude: row['longitude'],
+                             Order.customer_location: row['customer_location']},
+                            synchronize_session=False))
+    db.session.commit()
+    return updated
 
 def migrate_settings_data():
     """Migrate settings data from JSON to database"""
+    if Settings.query.first() is not None:
+        return 0
+    
     settings_file = os.path.join('data', 'settings.json')
     if os.path.exists(settings_file):
         with open(settings_file, 'r', encoding='utf-8') as f:
@@ -119,6 +261,7 @@ def migrate_settings_data():
         
         db.session.commit()
         print("Migrated settings to database")
+        return len(settings_data)
     else:
         # Create default settings
         default_settings = {
@@ -147,12 +290,54 @@ def migrate_settings_data():
         
         db.session.commit()
         print("Created default settings in database")
+        return len(default_settings)
+
+# Applied once each, in order, by run_data_migrations()
+DATA_MIGRATIONS = [
+    ('menu_json', migrate_menu_data),
+    ('settings_json', migrate_settings_data),
+    ('orders_json', migrate_orders_data),
+    ('orders_json_positions', migrate_order_positions),
+]
+
+# Decoded settings per key: key -> (updated_at, value). Values are shared
+# between requests and must be treated as read-only.
+_settings_cache = {}
+
+def _cached_setting(key, updated_at):
+    """Get the decoded value of a setting, decoding it only if it changed"""
+    cached = _settings_cache.get(key)
+    if cached is not None and cached[0] == updated_at:
+        return cached[1]
+    
+    raw = db.session.query(Settings.value).filter_by(key=key).scalar()
+    value = json.loads(raw) if raw else {}
+    _settings_cache[key] = (updated_at, value)
+    return value
+
+def get_setting(key, default=None):
+    """Get one setting, revalidated against Settings.updated_at.
+
+    The row is found through the unique index on `key`, and only its
+    updated_at is read while the cached value is still current, so other
+    workers' updates are seen on the next call.
+    """
+    row = db.session.query(Settings.updated_at).filter_by(key=key).first()
+    if row is None:
+        _settings_cache.pop(key, None)
+        return default
+    return _cached_setting(key, row.updated_at)
+
+def settings_revision(key):
+    """updated_at of the cached value of a setting, as last seen by get_setting()"""
+    cached = _settings_cache.get(key)
+    return cached[0] if cached else None
 
 def get_settings():
     """Get all settings from database"""
     settings = {}
-    for setting in Settings.query.all():
-        settings[setting.key] = json.loads(setting.value)
+    for key, updated_at in db.session.query(Settings.key, Settings.updated_at):
+        settings[key] = _cached_setting(key, updated_at)
     return settings
 
 def update_setting(key, value):
@@ -164,9 +349,235 @@ def update_setting(key, value):
     else:
         setting = Settings(
             key=key,
-            value=json.dumps(value, ensure_ascii=False)
+            value=json.dumps(value, ensure_ascii=False),
+            updated_at=datetime.utcnow()
         )
         db.session.add(setting)
     
     db.session.commit()
-    return setting
\ No newline at end of file
+    _settings_cache[key] = (setting.updated_at, value)
+    return setting
+
+def encode_order_cursor(order):
+    """Encode the (created_at, id) position of an order as an opaque cursor"""
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_order_cursor(cursor):
+    """Decode a cursor produced by encode_order_cursor, or None if invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, order_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeError):
+        return None
+
+def filter_orders(query, status=None, date_from=None, date_to=None):
+    """Apply the admin status and date-range filters (date_to is inclusive)"""
+    if status:
+        query = query.filter(Order.status == status)
+    if date_from:
+        query = query.filter(Order.created_at >= date_from)
+    if date_to:
+        query = query.filter(Order.created_at < date_to + timedelta(days=1))
+    return query
+
+def get_orders_page(cursor=None, per_page=50, status=None, date_from=None, date_to=None):
+    """Get one page of orders, newest first, using keyset pagination.
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    """
+    query = filter_orders(Order.query, status, date_from, date_to)
+    
+    position = decode_order_cursor(cursor) if cursor else None
+    if position:
+        created_at, order_id = position
+        query = query.filter(or_(
+            Order.created_at < created_at,
+            and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+    
+    # Fetch one extra row to know whether another page exists
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(per_page + 1).all()
+    
+    next_cursor = None
+    if len(orders) > per_page:
+        orders = orders[:per_page]
+        next_cursor = encode_order_cursor(orders[-1])
+    
+    return orders, next_cursor
+
+def get_order_status_summary(date_from=None, date_to=None):
+    """Get order counts and revenue per status in a single grouped query"""
+    query = db.session.query(
+        Order.status,
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.total_amount), 0)
+    )
+    query = filter_orders(query, date_from=date_from, date_to=date_to)
+    
+    by_status = {}
+    for status, count, revenue in query.group_by(Order.status):
+        by_status[status] = {'count': count, 'revenue': float(revenue)}
+    
+    return {
+        'by_status': by_status,
+        'total_orders': sum(s['count'] for s in by_status.values()),
+        'total_sales': sum(s['revenue'] for s in by_status.values())
+    }
+
+def get_orders_feed_state():
+    """Get (latest updated_at, order count) used to version the admin feed"""
+    return db.session.query(func.max(Order.updated_at), func.count(Order.id)).one()
+
+def get_orders_changed_since(since, limit=100):
+    """Get orders created or updated at or after `since`, oldest change first"""
+    # >= rather than > so a change committed within the same timestamp as the
+    # client's cursor is not lost; re-sending an order is harmless
+    return (Order.query
+            .filter(Order.updated_at >= since)
+            .order_by(Order.updated_at.asc(), Order.id.asc())
+            .limit(limit)
+            .all())
+
+def get_orders_to_deliver(statuses, limit=500):
+    """Orders with a delivery position that still wait for a driver, oldest first"""
+    return (Order.query
+            .filter(Order.status.in_(statuses), Order.latitude.isnot(None), Order.longitude.isnot(None))
+            .order_by(Order.created_at, Order.id)
+            .limit(limit)
+            .all())
+
+def get_cache_version(name):
+    """Get the shared version counter of an in-memory cache"""
+    version = db.session.query(CacheVersion.version).filter_by(name=name).scalar()
+    return version or 0
+
+def bump_cache_version(name):
+    """Increment a cache version in the current transaction (caller commits)"""
+    updated = (CacheVersion.query
+               .filter_by(name=name)
+               .update({CacheVersion.version: CacheVersion.version + 1}))
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+def order_item_rows(order_id, items, created_at, categories):
+    """Build order_items rows from the decoded items of an order"""
+    rows = []
+    for item in items:
+        menu_item_id = item.get('id')
+        rows.append({
+            'order_id': order_id,
+            'menu_item_id': menu_item_id,
+            'name': item.get('name') or '',
+            'category': item.get('category') or categories.get(menu_item_id),
+            'price': item.get('price') or 0,
+            'quantity': item.get('quantity') or 1,
+            'created_at': created_at
+        })
+    return rows
+
+def add_order_items(order, items, categories):
+    """Attach normalized line items to a new order (caller commits)"""
+    order.created_at = order.created_at or datetime.utcnow()
+    for row in order_item_rows(None, items, order.created_at, categories):
+        row.pop('order_id')
+        order.line_items.append(OrderItem(**row))
+
+def backfill_order_items(batch_size=500):
+    """Populate order_items for orders that predate it, one batch at a time.
+
+    Orders are streamed by primary key so memory stays bounded regardless of
+    the number of orders; each batch is committed on its own, so the job can
+    be interrupted and re-run.
+    """
+    categories = dict(db.session.query(MenuItem.id, MenuItem.category))
+    has_items = db.session.query(OrderItem.id).filter(OrderItem.order_id == Order.id).exists()
+    
+    last_id = 0
+    orders_done = 0
+    rows_done = 0
+    while True:
+        batch = (db.session.query(Order.id, Order.items, Order.created_at)
+                 .filter(Order.id > last_id, ~has_items)
+                 .order_by(Order.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        
+        rows = []
+        for order_id, items, created_at in batch:
+            try:
+                decoded = json.loads(items) if items else []
+            except ValueError:
+                decoded = []
+            rows.extend(order_item_rows(order_id, decoded, created_at, categories))
+        
+        if rows:
+            db.session.execute(insert(OrderItem), rows)
+        db.session.commit()
+        
+        last_id = batch[-1][0]
+        orders_done += len(batch)
+        rows_done += len(rows)
+        print(f"Backfilled {orders_done} orders ({rows_done} line items)")
+    
+    return orders_done, rows_done
+
+# Crockford base32: no I, L, O or U, so codes survive being read out or retyped
+TRACKING_CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+TRACKING_CODE_LENGTH = 10  # 50 random bits
+
+# Public tracking status per code; short-lived because other workers do not
+# see the invalidation done by update_order_status
+tracking_cache = TTLCache('order_tracking', ttl=5, maxsize=10000)
+
+def generate_tracking_code():
+    return ''.join(secrets.choice(TRACKING_CODE_ALPHABET) for _ in range(TRACKING_CODE_LENGTH))
+
+def normalize_tracking_code(code):
+    """Tracking code as typed by a customer, in its stored form"""
+    return (code or '').strip().upper()
+
+def save_new_order(order, attempts=3, before_commit=None):
+    """Commit a new order under a fresh tracking code.
+
+    A collision of 50 random bits is rare enough that a couple of redraws
+    always suffice; any other integrity error is raised immediately.
+    `before_commit(order)` runs once the order has its id, in the same
+    transaction.
+    """
+    for attempt in range(attempts):
+        # A code drawn by the caller is kept unless it is taken
+        if attempt or not order.tracking_code:
+            order.tracking_code = generate_tracking_code()
+        db.session.add(order)
+        try:
+            db.session.flush()
+            if before_commit:
+                before_commit(order)
+            db.session.commit()
+            return order
+        except IntegrityError:
+            db.session.rollback()
+            taken = Order.query.filter_by(tracking_code=order.tracking_code).first() is not None
+            if not taken or attempt == attempts - 1:
+                raise
+
+def get_order_tracking(tracking_code):
+    """Public status of an order by tracking code, or None if there is none"""
+    def load():
+        order = Order.query.filter_by(tracking_code=tracking_code).first()
+        if order is None:
+            return None
+        return {
+            'id': order.id,
+            'tracking_code': order.tracking_code,
+            'order_number': order.order_number,
+            'status': order.status,
+            'total': order.total,
+            'created_at': order.created_at.isoformat() if order.created_at else None,
+            'updated_at': order.updated_at.isoformat() if order.updated_at else None
+        }
+    return tracking_cache.get_or_set(tracking_code, load)
@@ -0,0 +1,133 @@
+"""Per-request database instrumentation: query count, SQL time and pool wait."""
+import threading
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+
+def _request_stats():
+    """Counters of the current request, or None outside a request"""
+    return g.get('db_stats') if has_app_context() else None
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = _request_stats()
+            if stats is not None:
+                stats['pool_wait'] += time.perf_counter() - start
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_query(conn)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed query never reaches after_cursor_execute; without this its start
+    # time would stay on the stack and skew the next query of the connection
+    if context.connection is not None and context.statement is not None:
+        _finish_query(context.connection)
+
+
+def _finish_query(conn):
+    started = conn.info.get('query_start')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = _request_stats()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['sql_time'] += elapsed
+
+
+def _is_sqlite_memory(uri):
+    url = make_url(uri)
+    return (url.get_backend_name() == 'sqlite'
+            and (url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'))
+
+
+class DBStats:
+    """Collects database usage per request and keeps per-endpoint totals"""
+    
+    def __init__(self):
+        self.app = None
+        # endpoint -> {'requests', 'queries', 'sql_time', 'pool_wait'}
+        self.endpoints = {}
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Install the timed pool and request hooks (call before db.init_app)"""
+        self.app = app
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        if _is_sqlite_memory(app.config.get('SQLALCHEMY_DATABASE_URI') or 'sqlite://'):
+            # An in-memory database lives in one connection (Flask-SQLAlchemy
+            # uses a StaticPool), which takes no queue pool options
+            for option in ('poolclass', 'pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(option, None)
+        else:
+            options.setdefault('poolclass', TimedQueuePool)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+    
+    def start_request(self):
+        g.db_stats = {'queries': 0, 'sql_time': 0.0, 'pool_wait': 0.0}
+    
+    def finish_request(self, response):
+        stats = g.pop('db_stats', None)
+        if stats is None:
+            return response
+        
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            totals = self.endpoints.setdefault(
+                endpoint, {'requests': 0, 'queries': 0, 'sql_time': 0.0, 'pool_wait': 0.0})
+            totals['requests'] += 1
+            for field, value in stats.items():
+                totals[field] += value
+        
+        sql_ms = stats['sql_time'] * 1000
+        wait_ms = stats['pool_wait'] * 1000
+        config = self.app.config
+        if stats['queries'] > config['DB_WARN_QUERIES'] or wait_ms > config['DB_WARN_POOL_WAIT_MS']:
+            print(f"DB warning: {request.method} {request.path} ran {stats['queries']} queries "
+                  f"({sql_ms:.1f} ms SQL, {wait_ms:.1f} ms pool wait, pool {self.pool_status()})")
+        
+        if config['DB_STATS_HEADERS']:
+            response.headers['X-DB-Queries'] = str(stats['queries'])
+            response.headers['X-DB-Time'] = f'{sql_ms:.1f}ms'
+            response.headers['X-DB-Pool-Wait'] = f'{wait_ms:.1f}ms'
+            response.headers.add('Server-Timing', f'db;dur={sql_ms:.1f};desc="{stats["queries"]} queries"')
+            response.headers.add('Server-Timing', f'db-pool;dur={wait_ms:.1f}')
+        return response
+    
+    def pool_status(self):
+        """Connections of this worker's pool: size, checked out and overflow"""
+        pool = db.engine.pool
+        if not isinstance(pool, QueuePool):
+            return {}
+        return {'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': max(pool.overflow(), 0)}
+    
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(totals) for endpoint, totals in self.endpoints.items()}
+
+
+db_stats = DBStats()
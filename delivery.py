@@ -0,0 +1,294 @@
+"""Delivery zones, distances, fees and driver routes, computed locally.
+
+Zones are polygons kept in the 'delivery_zones' setting, in the order they
+are checked (the first zone containing a point wins):
+
+    {"origin": [33.8935, -5.5473],
+     "zones": [{"name": "وسط المدينة", "polygon": [[lat, lng], ...],
+                "fee": 10, "fee_per_km": 0}]}
+
+Points are located through a uniform grid: each cell lists the zones whose
+bounding box overlaps it, so only a few polygons are tested. The grid is
+rebuilt when the setting changes. Distances are great-circle distances from
+the restaurant (`origin`), computed with NumPy for many points at once.
+
+A customer who does not share a position still gets delivery at the flat
+fee (app_settings.delivery_fee): the position is optional at checkout and
+the driver goes by the written address.
+"""
+import math
+import threading
+
+import numpy as np
+
+from database import get_setting, settings_revision
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Grid cells an index may use before the zones are refused as too large
+MAX_GRID_CELLS = 100000
+
+# Orders a driver can still be assigned to
+AWAITING_DRIVER_STATUSES = ('جديد', 'قيد التحضير', 'جاهز')
+
+
+def valid_position(lat, lng):
+    """Whether a latitude and longitude are finite and in range"""
+    return (math.isfinite(lat) and math.isfinite(lng)
+            and -90 <= lat <= 90 and -180 <= lng <= 180)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Distances in km from one point to arrays of points"""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lng2 = np.radians(np.asarray(lngs, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def pairwise_km(lats, lngs):
+    """Matrix of the distances in km between all pairs of points"""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def points_in_polygon(lats, lngs, polygon):
+    """Which points lie inside the polygon (ray casting over all edges at once)"""
+    lats = np.asarray(lats, dtype=float)[:, None]
+    lngs = np.asarray(lngs, dtype=float)[:, None]
+    y1, x1 = polygon[:, 0], polygon[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    
+    crosses = (y1 > lats) != (y2 > lats)
+    # Horizontal edges never cross the ray; their division is masked out
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_at = x1 + (lats - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (lngs < x_at), axis=1) % 2 == 1
+
+
+class Zone:
+    def __init__(self, name, polygon, fee, fee_per_km=0):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=float)
+        if self.polygon.ndim != 2 or self.polygon.shape[1] != 2 or len(self.polygon) < 3:
+            raise ValueError(f"Zone '{name}' needs a polygon of at least 3 [lat, lng] points")
+        if not all(valid_position(lat, lng) for lat, lng in self.polygon.tolist()):
+            raise ValueError(f"Zone '{name}' has a point outside -90..90 / -180..180")
+        self.fee = float(fee)
+        self.fee_per_km = float(fee_per_km)
+        self.min_lat, self.min_lng = map(float, self.polygon.min(axis=0))
+        self.max_lat, self.max_lng = map(float, self.polygon.max(axis=0))
+        points = self.polygon.tolist()
+        self._edges = list(zip(points, points[1:] + points[:1]))
+    
+    def contains(self, lat, lng):
+        """Whether one point is inside (plain Python: NumPy costs more for a single point)"""
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng):
+            return False
+        inside = False
+        for (y1, x1), (y2, x2) in self._edges:
+            if (y1 > lat) != (y2 > lat) and lng < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+    
+    def fee_for(self, distance_km):
+        return round(self.fee + self.fee_per_km * (distance_km or 0), 2)
+
+
+class ZoneIndex:
+    """Zones and a grid of cell -> candidate zones, for point lookups"""
+    
+    def __init__(self, zones, origin=None, cell_size=0.01, max_cells=MAX_GRID_CELLS):
+        self.zones = zones
+        self.origin = origin
+        self.cell_size = cell_size
+        self.cells = {}
+        bounds = [self._cell(zone.min_lat, zone.min_lng) + self._cell(zone.max_lat, zone.max_lng)
+                  for zone in zones]
+        # Counted before building: a continent-sized zone must not fill memory
+        needed = sum((max_row - min_row + 1) * (max_col - min_col + 1)
+                      for min_row, min_col, max_row, max_col in bounds)
+        if needed > max_cells:
+            raise ValueError(f"zones cover {needed} grid cells, more than the {max_cells} allowed; "
+                             f"draw smaller zones or raise DELIVERY_GRID_CELL_DEGREES")
+        for zone, (min_row, min_col, max_row, max_col) in zip(zones, bounds):
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    self.cells.setdefault((row, col), []).append(zone)
+    
+    @classmethod
+    def from_setting(cls, config, cell_size=0.01, max_cells=MAX_GRID_CELLS):
+        """Build the index from the 'delivery_zones' setting (ValueError if invalid)"""
+        config = config or {}
+        if not isinstance(config, dict):
+            raise ValueError("delivery zones must be a JSON object")
+        origin = config.get('origin')
+        if origin is not None:
+            if len(origin) != 2:
+                raise ValueError("origin must be [lat, lng]")
+            origin = (float(origin[0]), float(origin[1]))
+            if not valid_position(*origin):
+                raise ValueError("origin is outside -90..90 / -180..180")
+        zones = []
+        for zone in config.get('zones', []):
+            try:
+                zones.append(Zone(zone['name'], zone['polygon'], zone.get('fee', 0), zone.get('fee_per_km', 0)))
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Invalid zone {zone!r}: {e}")
+        return cls(zones, origin, cell_size, max_cells)
+    
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+    
+    def locate(self, lat, lng):
+        """The first zone containing the point, or None"""
+        for zone in self.cells.get(self._cell(lat, lng), ()):
+            if zone.contains(lat, lng):
+                return zone
+        return None
+    
+    def locate_many(self, lats, lngs):
+        """Zone of each point (None outside every zone)"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        found = [None] * len(lats)
+        unresolved = np.ones(len(lats), dtype=bool)
+        for zone in self.zones:
+            candidates = np.flatnonzero(unresolved
+                                        & (lats >= zone.min_lat) & (lats <= zone.max_lat)
+                                        & (lngs >= zone.min_lng) & (lngs <= zone.max_lng))
+            if not len(candidates):
+                continue
+            inside = candidates[points_in_polygon(lats[candidates], lngs[candidates], zone.polygon)]
+            for i in inside:
+                found[i] = zone
+            unresolved[inside] = False
+        return found
+    
+    def distances(self, lats, lngs):
+        """Distances from the restaurant, or None if its position is not set"""
+        if self.origin is None:
+            return None
+        return haversine_km(self.origin[0], self.origin[1], lats, lngs)
+
+
+class DeliveryZones:
+    SETTING_KEY = 'delivery_zones'
+    
+    def __init__(self):
+        self.cell_size = 0.01
+        self.max_cells = MAX_GRID_CELLS
+        self.route_max_stops = 5
+        self.route_radius_km = 2.0
+        self._index = None
+        self._revision = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.cell_size = app.config['DELIVERY_GRID_CELL_DEGREES']
+        self.max_cells = app.config['DELIVERY_GRID_MAX_CELLS']
+        self.route_max_stops = app.config['DELIVERY_ROUTE_MAX_STOPS']
+        self.route_radius_km = app.config['DELIVERY_ROUTE_RADIUS_KM']
+    
+    def index(self):
+        """Zone index of the current setting, rebuilt when it changes"""
+        config = get_setting(self.SETTING_KEY, {})
+        revision = settings_revision(self.SETTING_KEY)
+        with self._lock:
+            if self._index is None or revision != self._revision:
+                self._index = self.build(config)
+                self._revision = revision
+            return self._index
+    
+    def build(self, config):
+        """Zone index of a 'delivery_zones' value (ValueError if invalid or too large)"""
+        return ZoneIndex.from_setting(config, self.cell_size, self.max_cells)
+    
+    def quote(self, lat, lng):
+        """Zone, distance and fee of a delivery to a point (None coordinates: flat fee)"""
+        flat_fee = float(get_setting('app_settings', {}).get('delivery_fee') or 0)
+        if lat is None or lng is None:
+            return {'deliverable': True, 'zone': None, 'distance_km': None, 'fee': flat_fee}
+        
+        index = self.index()
+        distances = index.distances([lat], [lng])
+        distance = round(float(distances[0]), 2) if distances is not None else None
+        if not index.zones:
+            return {'deliverable': True, 'zone': None, 'distance_km': distance, 'fee': flat_fee}
+        
+        zone = index.locate(lat, lng)
+        if zone is None:
+            return {'deliverable': False, 'zone': None, 'distance_km': distance, 'fee': None}
+        return {'deliverable': True, 'zone': zone.name, 'distance_km': distance, 'fee': zone.fee_for(distance)}
+    
+    def routes(self, orders):
+        """Group orders into driver routes of nearby stops.
+        
+        The stop farthest from the restaurant starts a route, and the
+        closest stops within `route_radius_km` of it join, up to
+        `route_max_stops`. Stops are then ordered nearest-first from the
+        restaurant. Orders without coordinates are left out.
+        """
+        orders = [order for order in orders if order.latitude is not None and order.longitude is not None]
+        if not orders:
+            return []
+        
+        index = self.index()
+        lats = np.array([order.latitude for order in orders])
+        lngs = np.array([order.longitude for order in orders])
+        between = pairwise_km(lats, lngs)
+        from_origin = index.distances(lats, lngs)
+        zones = index.locate_many(lats, lngs)
+        
+        unassigned = np.ones(len(orders), dtype=bool)
+        routes = []
+        while unassigned.any():
+            if from_origin is not None:
+                seed = int(np.argmax(np.where(unassigned, from_origin, -1)))
+            else:
+                seed = int(np.flatnonzero(unassigned)[0])
+            nearby = np.flatnonzero(unassigned & (between[seed] <= self.route_radius_km))
+            members = nearby[np.argsort(between[seed][nearby], kind='stable')][:self.route_max_stops]
+            unassigned[members] = False
+            
+            stops, distance = self._order_stops(list(members), between, from_origin)
+            routes.append({
+                'zones': sorted({zones[i].name for i in stops if zones[i] is not None}),
+                'distance_km': round(distance, 2),
+                'orders': [{
+                    'id': orders[i].id,
+                    'order_number': orders[i].order_number,
+                    'customer_name': orders[i].customer_name,
+                    'customer_address': orders[i].customer_address,
+                    'latitude': orders[i].latitude,
+                    'longitude': orders[i].longitude,
+                    'zone': zones[i].name if zones[i] is not None else None
+                } for i in stops]
+            })
+        return routes
+    
+    def _order_stops(self, members, between, from_origin):
+        """Nearest-neighbour stop order and its length (from the restaurant if known)"""
+        if from_origin is not None:
+            current = min(members, key=lambda i: from_origin[i])
+            distance = float(from_origin[current])
+        else:
+            current = members[0]
+            distance = 0.0
+        stops = [current]
+        remaining = set(members) - {current}
+        while remaining:
+            nearest = min(remaining, key=lambda i: between[current][i])
+            distance += float(between[current][nearest])
+            stops.append(nearest)
+            remaining.discard(nearest)
+            current = nearest
+        return stops, distance
+
+
+delivery_zones = DeliveryZones()
@@ -0,0 +1,241 @@
+"""Order event pub/sub feeding the admin live stream (Server-Sent Events).
+
+Two interchangeable brokers are available, selected with EVENT_BROKER:
+
+- ``memory``: in-process fan-out, enough for a single gunicorn worker.
+- ``database``: events are written to the ``order_events`` table and every
+  worker runs one poller thread that fans them out to its own subscribers,
+  so several workers behave like clients of a shared broker.
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from models import db, OrderEvent
+
+
+class Event:
+    def __init__(self, id, kind, data):
+        self.id = id
+        self.kind = kind
+        self.data = data
+    
+    def to_sse(self):
+        """Format the event as a Server-Sent Events message"""
+        payload = json.dumps(self.data, ensure_ascii=False, separators=(',', ':'))
+        return f"id: {self.id}\nevent: {self.kind}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    def __init__(self, broker, max_size=1000):
+        self.broker = broker
+        self.queue = queue.Queue(maxsize=max_size)
+    
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client must not block publishers; it will resync
+            # from the incremental feed when it reconnects
+            pass
+    
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    """In-process broker keeping a short replay buffer for Last-Event-ID"""
+    
+    def __init__(self, app, history=500):
+        self.app = app
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._ids = itertools.count(1)
+    
+    def publish(self, kind, data):
+        with self._lock:
+            event = Event(next(self._ids), kind, data)
+            self._history.append(event)
+        self._dispatch(event)
+        return event
+    
+    def subscribe(self, last_event_id=None):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+        # Subscribing before replaying may deliver an event twice, never zero
+        # times; clients apply events idempotently
+        if last_event_id:
+            for event in self.replay(last_event_id):
+                subscription.put(event)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+    
+    def replay(self, last_event_id):
+        with self._lock:
+            return [event for event in self._history if event.id > last_event_id]
+    
+    def _dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class DatabaseBroker(MemoryBroker):
+    """Broker shared by all workers through the order_events table"""
+    
+    def __init__(self, app, poll_interval=0.5, retention=timedelta(hours=1), lookback=timedelta(seconds=10)):
+        super().__init__(app)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.lookback = lookback
+        self._poller = None
+        self._last_id = None
+        self._seen = {}  # id -> created_at of events delivered within the lookback
+        self._published = 0
+    
+    def publish(self, kind, data):
+        # Delivered to local subscribers by the poller, like any other worker
+        event = OrderEvent(kind=kind, payload=json.dumps(data, ensure_ascii=False))
+        db.session.add(event)
+        db.session.commit()
+        
+        self._published += 1
+        if self._published % 100 == 0:
+            self._prune()
+        
+        return Event(event.id, kind, data)
+    
+    def subscribe(self, last_event_id=None):
+        # Started lazily so no thread or connection exists before gunicorn forks
+        self._ensure_poller()
+        return super().subscribe(last_event_id)
+    
+    def replay(self, last_event_id):
+        with self.app.app_context():
+            rows = (OrderEvent.query
+                    .filter(OrderEvent.id > last_event_id)
+                    .order_by(OrderEvent.id)
+                    .limit(self._history.maxlen)
+                    .all())
+            return [self._to_event(row) for row in rows]
+    
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is not None and self._poller.is_alive():
+                return
+            with self.app.app_context():
+                self._last_id = db.session.query(db.func.max(OrderEvent.id)).scalar() or 0
+                # Events already in the lookback window predate the subscribers
+                cutoff = datetime.utcnow() - self.lookback
+                self._seen = dict(db.session.query(OrderEvent.id, OrderEvent.created_at)
+                                  .filter(OrderEvent.created_at >= cutoff))
+            self._poller = threading.Thread(target=self._poll, name='order-events', daemon=True)
+            self._poller.start()
+    
+    def _poll(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    events = self._fetch_new()
+                for event in events:
+                    self._dispatch(event)
+            except Exception as e:
+                print(f"Order event poller error: {e}")
+            time.sleep(self.poll_interval)
+    
+    def _fetch_new(self):
+        """Events not delivered yet, oldest id first.
+        
+        Ids come from a sequence but concurrent transactions commit out of
+        order, so a lower id can appear after higher ones were delivered.
+        Recent rows are therefore scanned again for `lookback` and
+        deduplicated by id.
+        """
+        cutoff = datetime.utcnow() - self.lookback
+        rows = (OrderEvent.query
+                .filter(db.or_(OrderEvent.id > self._last_id, OrderEvent.created_at >= cutoff))
+                .order_by(OrderEvent.id)
+                .limit(1000)
+                .all())
+        events = []
+        for row in rows:
+            if row.id in self._seen:
+                continue
+            self._seen[row.id] = row.created_at
+            self._last_id = max(self._last_id, row.id)
+            events.append(self._to_event(row))
+        # Rows older than the window are not scanned again
+        self._seen = {event_id: created_at for event_id, created_at in self._seen.items()
+                      if created_at and created_at >= cutoff}
+        return events
+    
+    def _prune(self):
+        cutoff = datetime.utcnow() - self.retention
+        OrderEvent.query.filter(OrderEvent.created_at < cutoff).delete()
+        db.session.commit()
+    
+    @staticmethod
+    def _to_event(row):
+        return Event(row.id, row.kind, json.loads(row.payload))
+
+
+BROKERS = {
+    'memory': MemoryBroker,
+    'database': DatabaseBroker,
+}
+
+
+def init_events(app):
+    """Create the configured broker and attach it to the app"""
+    broker_class = BROKERS[app.config.get('EVENT_BROKER', 'memory')]
+    if broker_class is DatabaseBroker:
+        broker = DatabaseBroker(app, poll_interval=app.config.get('EVENT_POLL_INTERVAL', 0.5),
+                                lookback=timedelta(seconds=app.config.get('EVENT_POLL_LOOKBACK_SECONDS', 10)))
+    else:
+        broker = broker_class(app)
+    app.extensions['order_events'] = broker
+    
+    # Streams beyond the worker's stream threads are refused, not queued
+    # behind customer requests
+    max_clients = app.config.get('EVENT_STREAM_MAX_CLIENTS')
+    app.extensions['event_stream_slots'] = threading.BoundedSemaphore(max_clients) if max_clients else None
+    return broker
+
+
+def stream_events(broker, last_event_id=None, heartbeat=15, max_duration=300):
+    """Yield SSE messages until max_duration, then let the client reconnect.
+
+    Bounding the stream duration keeps a long-lived connection from pinning a
+    worker thread forever; EventSource reconnects with Last-Event-ID.
+    """
+    subscription = broker.subscribe(last_event_id)
+    deadline = time.monotonic() + max_duration
+    try:
+        yield "retry: 1000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = subscription.get(timeout=min(heartbeat, remaining))
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield event.to_sse()
+    finally:
+        subscription.close()
@@ -1,10 +1,64 @@
+import multiprocessing
 import os
+import shutil
+import tempfile
+
+from config import (DB_MAX_CONNECTIONS, DB_MAX_OVERFLOW, DB_POOL_SIZE, EVENT_STREAM_THREADS,
+                    WORKER_CLASS, WORKER_THREADS)
 
 bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
-workers = 1
-worker_class = "sync"
-worker_connections = 1000
+
+# One process per core (plus one), each serving several requests at once, so a
+# slow admin page or upload no longer blocks customers. Every worker may open
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so no more workers run than
+# DB_MAX_CONNECTIONS allows.
+requested_workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+connections_per_worker = DB_POOL_SIZE + DB_MAX_OVERFLOW
+workers = max(1, min(requested_workers, DB_MAX_CONNECTIONS // connections_per_worker))
+if workers < requested_workers:
+    print(f"Running {workers} workers instead of {requested_workers}: {connections_per_worker} "
+          f"database connections each must fit in DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS}")
+
+# gthread: a long-lived admin event stream (SSE) occupies one thread, not the
+# whole worker, and streams get EVENT_STREAM_THREADS threads of their own.
+# gevent (pip install gevent) serves worker_connections concurrent requests
+# per worker instead.
+worker_class = WORKER_CLASS
+threads = WORKER_THREADS + (EVENT_STREAM_THREADS if WORKER_CLASS == 'gthread' else 0)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
 max_requests = 1000
 max_requests_jitter = 100
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# The app is imported once in the master. create_app() opens no database
+# connection and starts no thread unless RUN_MIGRATIONS_ON_STARTUP is set;
+# post_fork discards any pooled connection inherited from the master anyway.
 preload_app = True
-timeout = 120
\ No newline at end of file
+
+# Prometheus samples of every worker are written here and merged by /metrics.
+# It is created before the app is loaded and emptied so a restart starts from zero.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'foodie-metrics'))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    from app import app
+    from models import db
+    
+    with app.app_context():
+        # close=False leaves the parent's sockets alone and just forgets them
+        db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    # Drop the exited worker's gauges; its counters keep counting in the totals
+    multiprocess.mark_process_dead(worker.pid)
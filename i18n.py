@@ -0,0 +1,52 @@
+"""Interface translations loaded from translations/<language>.json.
+
+Adding a language means adding a file. Each catalog is merged over the
+default language at load time, so a missing key falls back to it without a
+second lookup. The language is read from the session once per request.
+"""
+import json
+import os
+
+from flask import g, session
+
+
+class Translations:
+    def __init__(self, default_language='ar'):
+        self.default_language = default_language
+        self.catalogs = {}
+    
+    def init_app(self, app):
+        self.default_language = app.config.get('DEFAULT_LANGUAGE', self.default_language)
+        folder = os.path.join(app.root_path, app.config.get('TRANSLATIONS_FOLDER', 'translations'))
+        self.catalogs = self.load(folder)
+        if self.default_language not in self.catalogs:
+            raise RuntimeError(f"No translation file for the default language '{self.default_language}'")
+    
+    def load(self, folder):
+        catalogs = {}
+        for filename in sorted(os.listdir(folder)):
+            language, extension = os.path.splitext(filename)
+            if extension == '.json':
+                with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
+                    catalogs[language] = json.load(f)
+        
+        default = catalogs.get(self.default_language, {})
+        return {language: {**default, **catalog} for language, catalog in catalogs.items()}
+    
+    def language(self):
+        """Language of the current request"""
+        if 'language' not in g:
+            language = session.get('language')
+            if language not in self.catalogs:
+                language = self.default_language
+            g.language = language
+            g.translations = self.catalogs[language]
+        return g.language
+    
+    def gettext(self, key):
+        if 'translations' not in g:
+            self.language()
+        return g.translations.get(key, key)
+
+
+translations = Translations()
@@ -0,0 +1,155 @@
+"""Menu image uploads: content-hashed originals plus responsive variants.
+
+The upload request only hashes and stores the original; resized WebP/JPEG
+variants are produced by a small background thread pool. Templates get a
+`srcset` for whichever variants exist, so a page rendered before the pool
+finishes simply falls back to the original image. Once an image's variants
+are all on disk the catalog version is bumped, so every worker re-renders
+its cached menu pages with the new srcset.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import url_for
+
+from cache import TTLCache
+from catalog import menu_catalog
+from models import db
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; originals are served unchanged
+    Image = None
+
+VARIANT_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Variants found on disk per image, rescanned after a short TTL because they
+# are written asynchronously (possibly by another worker). Images without
+# variants yet are not cached, so a re-render right after they appear sees them.
+_variants_cache = TTLCache('image_variants', ttl=30, maxsize=4096)
+
+
+class ImagePipeline:
+    def __init__(self):
+        self.upload_folder = 'static/images'
+        self.widths = (320, 640, 1024)
+        self.max_workers = 2
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.app = app
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.widths = tuple(app.config.get('IMAGE_VARIANT_WIDTHS', self.widths))
+        self.max_workers = app.config.get('IMAGE_WORKERS', self.max_workers)
+        os.makedirs(self.upload_folder, exist_ok=True)
+    
+    def executor(self):
+        # Created on first upload, i.e. after gunicorn has forked the worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='image-variants')
+            return self._executor
+    
+    def save_upload(self, file):
+        """Store an uploaded image under its content hash and queue its variants"""
+        data = file.read()
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        filename = f"{digest}.{extension}"
+        
+        path = os.path.join(self.upload_folder, filename)
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        
+        if Image is not None:
+            self.executor().submit(self.generate_variants, filename)
+        return filename
+    
+    def variant_name(self, filename, width, extension):
+        stem = filename.rsplit('.', 1)[0]
+        return f"{stem}-{width}.{extension}"
+    
+    def generate_variants(self, filename):
+        """Write every width/format variant smaller than the original"""
+        try:
+            written = []
+            with Image.open(os.path.join(self.upload_folder, filename)) as original:
+                image = ImageOps.exif_transpose(original)
+                for width in self.widths:
+                    if width >= image.width:
+                        break
+                    height = round(image.height * width / image.width)
+                    resized = image.resize((width, height), Image.LANCZOS)
+                    for extension, options in VARIANT_FORMATS.items():
+                        target = resized
+                        if options['format'] == 'JPEG' and target.mode != 'RGB':
+                            target = target.convert('RGB')
+                        path = os.path.join(self.upload_folder, self.variant_name(filename, width, extension))
+                        target.save(path + '.tmp', **options)
+                        written.append(path)
+            # Published together, so a page never renders a partial srcset
+            for path in written:
+                os.replace(path + '.tmp', path)
+            _variants_cache.delete(filename)
+            if written:
+                self._variants_ready()
+        except Exception as e:
+            print(f"Image variant error for {filename}: {e}")
+    
+    def _variants_ready(self):
+        # Menu pages are cached per catalog version
+        with self.app.app_context():
+            menu_catalog.touch()
+            db.session.commit()
+    
+    def variants(self, filename):
+        """Map of extension -> [(width, variant filename)] present on disk"""
+        found = _variants_cache.get(filename)
+        if found is not None:
+            return found
+        
+        found = {}
+        for extension in VARIANT_FORMATS:
+            for width in self.widths:
+                name = self.variant_name(filename, width, extension)
+                if os.path.exists(os.path.join(self.upload_folder, name)):
+                    found.setdefault(extension, []).append((width, name))
+        if found:
+            _variants_cache.set(filename, found)
+        return found
+    
+    def srcset(self, filename, extension='webp'):
+        """srcset attribute value for an image, or '' when it has no variants"""
+        if not filename:
+            return ''
+        return ', '.join(
+            f"{url_for('static', filename='images/' + name)} {width}w"
+            for width, name in self.variants(filename).get(extension, [])
+        )
+    
+    def delete(self, filename):
+        """Remove an image and all of its generated variants"""
+        names = [filename] + [
+            self.variant_name(filename, width, extension)
+            for width in self.widths
+            for extension in VARIANT_FORMATS
+        ]
+        for name in names:
+            path = os.path.join(self.upload_folder, name)
+            if os.path.exists(path):
+                os.remove(path)
+        _variants_cache.delete(filename)
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,180 @@
+"""Durable background jobs stored in the jobs table.
+
+Requests enqueue a job and return right away; a job that belongs to a
+database change is added to that change's transaction, so it exists if and
+only if the change was committed. Worker threads in every
+gunicorn worker claim due jobs with a conditional UPDATE, so a job runs
+in one place only. A failed job is retried with exponential backoff until
+it runs out of attempts. Jobs left 'running' by a worker that died are
+picked up again after JOB_LOCK_TIMEOUT.
+"""
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import db, Job
+from metrics import metrics
+
+
+class JobQueue:
+    def __init__(self):
+        self.app = None
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._finished = 0
+        self._last_recovery = None
+    
+    def init_app(self, app):
+        self.app = app
+        self.num_workers = app.config['JOB_WORKERS']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+        self.backoff = app.config['JOB_BACKOFF_SECONDS']
+        self.max_backoff = app.config['JOB_MAX_BACKOFF_SECONDS']
+        self.lock_timeout = timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'])
+        self.retention = timedelta(seconds=app.config['JOB_RETENTION_SECONDS'])
+        # Workers start with the first request, i.e. after gunicorn forks
+        app.before_request(self._ensure_workers)
+        # init_app can run more than once; the session needs one listener
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+    
+    def handler(self, kind):
+        """Register the function that runs jobs of `kind` with their payload"""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+    
+    def add(self, kind, payload, delay=0):
+        """Add a job to the current transaction; a local worker wakes up once it commits"""
+        job = Job(kind=kind,
+                  payload=json.dumps(payload, ensure_ascii=False),
+                  max_attempts=self.max_attempts,
+                  run_at=datetime.utcnow() + timedelta(seconds=delay))
+        db.session.add(job)
+        db.session.info['jobs_added'] = True
+        return job
+    
+    def enqueue(self, kind, payload, delay=0):
+        """Store a job on its own (committing the session)"""
+        job = self.add(kind, payload, delay)
+        db.session.commit()
+        return job
+    
+    def _after_commit(self, session):
+        if session.info.pop('jobs_added', False):
+            self._wakeup.set()
+    
+    def _ensure_workers(self):
+        if self.num_workers <= 0 or len(self._workers) == self.num_workers:
+            return
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.num_workers:
+                worker = threading.Thread(target=self._work, daemon=True,
+                                          name=f'job-worker-{len(self._workers)}')
+                worker.start()
+                self._workers.append(worker)
+    
+    def _work(self):
+        while True:
+            ran = False
+            try:
+                with self.app.app_context():
+                    self._recover_stale()
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self._run(job_id)
+                        ran = True
+            except Exception as e:
+                print(f"Job worker error: {e}")
+            
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+    
+    def _claim(self):
+        """Mark the next due job as running and return its id (None if idle)"""
+        now = datetime.utcnow()
+        candidates = (db.session.query(Job.id)
+                      .filter(Job.status == 'pending', Job.run_at <= now)
+                      .order_by(Job.run_at, Job.id)
+                      .limit(5)
+                      .all())
+        db.session.commit()
+        
+        for (job_id,) in candidates:
+            # Only one worker (in any process) can win this update
+            claimed = (Job.query
+                       .filter(Job.id == job_id, Job.status == 'pending')
+                       .update({Job.status: 'running',
+                                Job.locked_at: now,
+                                Job.attempts: Job.attempts + 1},
+                               synchronize_session=False))
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+    
+    def _run(self, job_id):
+        job = db.session.get(Job, job_id)
+        kind = job.kind
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise LookupError(f"No handler for job kind '{kind}'")
+            handler(json.loads(job.payload))
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.last_error = f"{type(e).__name__}: {e}"[:1000]
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                print(f"Job {job_id} ({kind}) failed after {job.attempts} attempts: {e}")
+            else:
+                job.status = 'pending'
+                job.run_at = datetime.utcnow() + timedelta(seconds=self._backoff(job.attempts))
+            result = job.status
+        else:
+            job.status = 'done'
+            job.last_error = None
+            result = 'done'
+        job.locked_at = None
+        db.session.commit()
+        
+        metrics.record_job(kind, result)
+        
+        self._finished += 1
+        if self._finished % 100 == 0:
+            self._prune()
+    
+    def _backoff(self, attempts):
+        """Seconds before the next attempt: doubling, capped, with jitter"""
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+    
+    def _recover_stale(self):
+        """Requeue jobs whose worker died while running them (once a minute)"""
+        now = datetime.utcnow()
+        if self._last_recovery and now - self._last_recovery < timedelta(minutes=1):
+            return
+        self._last_recovery = now
+        (Job.query
+         .filter(Job.status == 'running', Job.locked_at < now - self.lock_timeout)
+         .update({Job.status: 'pending', Job.locked_at: None}, synchronize_session=False))
+        db.session.commit()
+    
+    def _prune(self):
+        # Failed jobs are kept for inspection
+        cutoff = datetime.utcnow() - self.retention
+        Job.query.filter(Job.status == 'done', Job.updated_at < cutoff).delete()
+        db.session.commit()
+
+
+job_queue = JobQueue()
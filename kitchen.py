@@ -0,0 +1,193 @@
+"""Estimated ready times of open orders, from the kitchen's queue.
+
+Each worker keeps the open orders ('جديد' and 'قيد التحضير') in memory with
+the time the kitchen needs for each one. Orders are placed on the parallel
+kitchen stations in order: those already being prepared first, then the new
+ones oldest first, each on the station that frees up soonest.
+
+The queue follows the order events already published for the admin
+dashboard: a worker applies its own changes directly, and every worker
+drains its event subscription on read. Nothing is written to the database
+for the queue; a full reload of the open orders every KITCHEN_RESYNC_SECONDS
+catches up with missed events and changes made outside the app.
+"""
+import heapq
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from catalog import menu_catalog
+from models import Order
+
+NEW_STATUS = 'جديد'
+IN_PROGRESS_STATUS = 'قيد التحضير'
+OPEN_STATUSES = (NEW_STATUS, IN_PROGRESS_STATUS)
+
+
+class QueuedOrder:
+    __slots__ = ('id', 'status', 'created_at', 'started_at', 'duration')
+    
+    def __init__(self, id, status, created_at, started_at, duration):
+        self.id = id
+        self.status = status
+        self.created_at = created_at
+        self.started_at = started_at
+        self.duration = duration
+
+
+class KitchenQueue:
+    def __init__(self):
+        self.app = None
+        self.stations = 2
+        self.extra_item_minutes = 2
+        self.default_prep_minutes = 15
+        self.revalidate_seconds = 1.0
+        self.resync_seconds = 60
+        self._orders = None  # order id -> QueuedOrder, None until loaded
+        self._applied = OrderedDict()  # order id -> updated_at of the last state applied
+        self._subscription = None
+        self._loaded_at = 0.0
+        self._schedule = None
+        self._scheduled_at = 0.0
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.app = app
+        self.stations = max(1, app.config['KITCHEN_STATIONS'])
+        self.extra_item_minutes = app.config['KITCHEN_EXTRA_ITEM_MINUTES']
+        self.default_prep_minutes = app.config['KITCHEN_DEFAULT_PREP_MINUTES']
+        self.revalidate_seconds = app.config.get('CATALOG_REVALIDATE_SECONDS', self.revalidate_seconds)
+        self.resync_seconds = app.config['KITCHEN_RESYNC_SECONDS']
+    
+    def duration(self, items):
+        """Kitchen time of an order: its longest dish, plus a little per extra portion"""
+        catalog = menu_catalog.get()
+        longest = 0
+        portions = 0
+        for line in items:
+            item = catalog.get_item(line.get('id'))
+            prep = (item or {}).get('preparation_time') or self.default_prep_minutes
+            longest = max(longest, prep)
+            portions += line.get('quantity', 1)
+        minutes = longest + self.extra_item_minutes * max(portions - 1, 0)
+        return timedelta(minutes=minutes)
+    
+    def _queued(self, order_id, status, items, created_at, updated_at):
+        # An order in preparation started when its status last changed
+        started_at = updated_at if status == IN_PROGRESS_STATUS else None
+        return QueuedOrder(order_id, status, created_at, started_at, self.duration(items))
+    
+    def _load(self):
+        orders = (Order.query
+                  .filter(Order.status.in_(OPEN_STATUSES))
+                  .order_by(Order.created_at, Order.id)
+                  .all())
+        queued = {}
+        for order in orders:
+            try:
+                items = json.loads(order.items) if order.items else []
+            except ValueError:
+                items = []
+            queued[order.id] = self._queued(order.id, order.status, items, order.created_at, order.updated_at)
+        self._orders = queued
+        self._applied.clear()
+        self._loaded_at = time.monotonic()
+        self._schedule = None
+    
+    def _apply(self, order):
+        """Apply an order state (an Order.to_dict() payload), unless a newer one was applied"""
+        updated_at = datetime.fromisoformat(order['updated_at']) if order.get('updated_at') else None
+        created_at = datetime.fromisoformat(order['created_at']) if order.get('created_at') else None
+        seen = self._applied.get(order['id'])
+        # Events of another worker can arrive after this worker's own, newer change
+        if seen is not None and updated_at is not None and updated_at < seen:
+            return
+        self._applied[order['id']] = updated_at or seen
+        self._applied.move_to_end(order['id'])
+        while len(self._applied) > 10000:
+            self._applied.popitem(last=False)
+        
+        if order['status'] in OPEN_STATUSES:
+            self._orders[order['id']] = self._queued(order['id'], order['status'], order.get('items') or [],
+                                                     created_at, updated_at)
+        else:
+            self._orders.pop(order['id'], None)
+        self._schedule = None
+    
+    def _sync(self):
+        """Load the open orders once, then follow the order events"""
+        with self._lock:
+            if self._subscription is None and self.app is not None:
+                # Subscribed on first use, i.e. after gunicorn forks
+                self._subscription = self.app.extensions['order_events'].subscribe()
+            
+            if self._orders is None or time.monotonic() - self._loaded_at > self.resync_seconds:
+                self._load()
+                if self._subscription is not None:
+                    # Everything queued so far is already in the reload
+                    while self._subscription.get(timeout=0) is not None:
+                        pass
+                return
+            
+            while self._subscription is not None:
+                event = self._subscription.get(timeout=0)
+                if event is None:
+                    break
+                if isinstance(event.data, dict) and 'status' in event.data:
+                    self._apply(event.data)
+    
+    def order_changed(self, order):
+        """Apply a committed order (new, or with a new status) to this worker's queue.
+        
+        Other workers get the change from the order event published for it.
+        """
+        with self._lock:
+            if self._orders is not None:
+                self._apply(order.to_dict())
+    
+    def schedule(self):
+        """Station, start and ready time of every open order"""
+        self._sync()
+        with self._lock:
+            if self._schedule is not None and time.monotonic() - self._scheduled_at < self.revalidate_seconds:
+                return self._schedule
+            
+            now = datetime.utcnow()
+            orders = sorted(self._orders.values(), key=lambda order: (
+                order.status != IN_PROGRESS_STATUS,
+                order.started_at or order.created_at or now,
+                order.id))
+            
+            stations = [(now, station) for station in range(self.stations)]
+            schedule = {}
+            for order in orders:
+                free_at, station = heapq.heappop(stations)
+                if order.started_at and free_at <= now:
+                    start = order.started_at
+                else:
+                    start = free_at
+                # An overdue order is expected any moment, not in the past
+                ready = max(start + order.duration, now)
+                schedule[order.id] = {'station': station + 1, 'start': start, 'ready': ready}
+                heapq.heappush(stations, (ready, station))
+            
+            self._schedule = schedule
+            self._scheduled_at = time.monotonic()
+            return schedule
+    
+    def eta(self, order_id):
+        """Estimated ready time of an open order, or None once it has left the kitchen"""
+        entry = self.schedule().get(order_id)
+        if entry is None:
+            return None
+        remaining = (entry['ready'] - datetime.utcnow()).total_seconds()
+        return {
+            'ready_at': entry['ready'].isoformat(),
+            'minutes': max(0, round(remaining / 60)),
+            'station': entry['station']
+        }
+
+
+kitchen_queue = KitchenQueue()
@@ -0,0 +1,162 @@
+"""Prometheus metrics served at /metrics.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set up in gunicorn_config.py) and a scrape of any worker merges them all.
+Without that directory, as with the development server, the process-local
+registry is exported instead.
+"""
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, abort, g, request
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from cache import CACHES
+from dbstats import db_stats
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                                   Counter, Gauge, Histogram, generate_latest, multiprocess)
+except ImportError:  # prometheus_client is optional; /metrics is then not registered
+    Counter = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Request, order, database and cache metrics of the app"""
+    
+    def __init__(self):
+        self.app = None
+        self.enabled = Counter is not None
+        # Cache counters already exported, per (cache, result)
+        self._cache_seen = {}
+        self._cache_lock = threading.Lock()
+        if not self.enabled:
+            return
+        
+        self.requests = Counter(
+            'foodie_http_requests_total', 'HTTP requests handled',
+            ['endpoint', 'method', 'status'])
+        self.latency = Histogram(
+            'foodie_http_request_duration_seconds', 'Time spent handling a request',
+            ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+        self.orders = Counter('foodie_orders_placed_total', 'Orders placed')
+        self.revenue = Counter('foodie_order_revenue_total', 'Total amount of placed orders')
+        self.db_queries = Counter(
+            'foodie_db_queries_total', 'SQL statements executed by requests', ['endpoint'])
+        self.db_time = Counter(
+            'foodie_db_query_seconds_total', 'Time requests spent in SQL', ['endpoint'])
+        self.db_pool_wait = Counter(
+            'foodie_db_pool_wait_seconds_total', 'Time requests waited for a pooled connection',
+            ['endpoint'])
+        # Gauges are summed over the workers that are still alive
+        self.pool_size = Gauge(
+            'foodie_db_pool_size', 'Connections kept in the pools', multiprocess_mode='livesum')
+        self.pool_checked_out = Gauge(
+            'foodie_db_pool_checked_out', 'Pooled connections in use', multiprocess_mode='livesum')
+        self.pool_overflow = Gauge(
+            'foodie_db_pool_overflow', 'Connections opened beyond the pool size',
+            multiprocess_mode='livesum')
+        self.cache_requests = Counter(
+            'foodie_cache_requests_total', 'In-process cache lookups', ['cache', 'result'])
+        self.jobs = Counter(
+            'foodie_jobs_total', 'Background job runs by outcome (done, pending = retry, failed)',
+            ['kind', 'result'])
+    
+    def init_app(self, app):
+        """Register the request hooks and the /metrics view (after db_stats.init_app)"""
+        self.app = app
+        if not self.enabled:
+            print("prometheus_client is not installed; /metrics is disabled")
+            return
+        
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        if app.config.get('METRICS_TOKEN_REQUIRED') and not app.config.get('METRICS_TOKEN'):
+            print("METRICS_TOKEN is not set; /metrics will not be served")
+        
+        # Follow connections as they leave and return to the pool, so a scrape
+        # does not count the connection of the request that samples it
+        if not event.contains(Pool, 'checkout', self.on_checkout):
+            event.listen(Pool, 'checkout', self.on_checkout)
+            event.listen(Pool, 'checkin', self.on_checkin)
+    
+    def start_request(self):
+        g.request_started = time.perf_counter()
+    
+    def finish_request(self, response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        
+        endpoint = request.endpoint or 'unmatched'
+        self.latency.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        self.requests.labels(endpoint, request.method, response.status_code).inc()
+        
+        # Registered after db_stats, so this hook runs before it pops the counters
+        stats = g.get('db_stats')
+        if stats and stats['queries']:
+            self.db_queries.labels(endpoint).inc(stats['queries'])
+            self.db_time.labels(endpoint).inc(stats['sql_time'])
+            self.db_pool_wait.labels(endpoint).inc(stats['pool_wait'])
+        
+        self.sync_pool()
+        self.sync_caches()
+        return response
+    
+    def record_order(self, order):
+        """Count a placed order and its amount"""
+        if self.enabled:
+            self.orders.inc()
+            self.revenue.inc(max(order.total_amount or 0, 0))
+    
+    def record_job(self, kind, result):
+        if self.enabled:
+            self.jobs.labels(kind, result).inc()
+    
+    def sync_pool(self):
+        status = db_stats.pool_status()
+        if status:
+            self.pool_size.set(status['size'])
+            self.pool_overflow.set(status['overflow'])
+    
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.pool_checked_out.inc()
+    
+    def on_checkin(self, dbapi_connection, connection_record):
+        self.pool_checked_out.dec()
+    
+    def sync_caches(self):
+        """Export the hits and misses counted by the caches since the last sync"""
+        with self._cache_lock:
+            for name, cache in list(CACHES.items()):
+                for result, count in (('hit', cache.hits), ('miss', cache.misses)):
+                    seen = self._cache_seen.get((name, result), 0)
+                    if count > seen:
+                        self.cache_requests.labels(name, result).inc(count - seen)
+                        self._cache_seen[name, result] = count
+    
+    def view(self):
+        token = self.app.config.get('METRICS_TOKEN')
+        if not token and self.app.config.get('METRICS_TOKEN_REQUIRED'):
+            # Worker, pool and order counts are not published without a token
+            abort(404)
+        if token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied, f'Bearer {token}'):
+                abort(401)
+        
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+metrics = Metrics()
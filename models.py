@@ -40,11 +40,22 @@ class MenuItem(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+# Statuses an order goes through, in order (the admin dashboard offers these)
+ORDER_STATUSES = ('جديد', 'قيد التحضير', 'جاهز', 'في الطريق', 'تم التوصيل')
+
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Keyset pagination for the admin order list (newest first)
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_status_created_at_id', 'status', 'created_at', 'id'),
+        # Incremental admin feed ("changed since")
+        db.Index('ix_orders_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    tracking_code = db.Column(db.String(20), unique=True, nullable=False)
+    # Unique index, also created on tables that predate it (ensure_indexes)
+    tracking_code = db.Column(db.String(20), unique=True, index=True, nullable=False)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_phone = db.Column(db.String(20), nullable=True)
     customer_address = db.Column(db.Text, nullable=True)
@@ -55,6 +66,21 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Delivery position picked at checkout, and the zone and fee it got
+    # (added to tables that predate them by ensure_columns)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    customer_location = db.Column(db.String(100))
+    delivery_zone = db.Column(db.String(50))
+    delivery_distance_km = db.Column(db.Float)
+    delivery_fee = db.Column(db.Float)
+    # Parts of total_amount besides the items (see pricing.py)
+    discount_amount = db.Column(db.Float)
+    tax_amount = db.Column(db.Float)
+    
+    # Normalized copy of `items` for indexed sales queries
+    line_items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan')
+    
     @property
     def total(self):
         """Calculate total price for the order"""
@@ -82,10 +108,89 @@ class Order(db.Model):
             'total': self.total,
             'status': self.status,
             'notes': self.notes,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'customer_location': self.customer_location,
+            'delivery_zone': self.delivery_zone,
+            'delivery_distance_km': self.delivery_distance_km,
+            'delivery_fee': self.delivery_fee,
+            'discount_amount': self.discount_amount,
+            'tax_amount': self.tax_amount,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class OrderItem(db.Model):
+    """One line of an order, denormalized with the order date for analytics"""
+    __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('ix_order_items_menu_item_created_at', 'menu_item_id', 'created_at'),
+        db.Index('ix_order_items_category_created_at', 'category', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    # No foreign key: sales history outlives deleted menu items
+    menu_item_id = db.Column(db.Integer)
+    name = db.Column(db.String(100), nullable=False)
+    category = db.Column(db.String(50))
+    price = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ShoppingCart(db.Model):
+    """Server-side cart; the session cookie only carries its id"""
+    __tablename__ = 'carts'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    lines = db.Column(db.Text, nullable=False, default='{}')  # JSON: item id -> quantity
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class OrderEvent(db.Model):
+    """Order change published to other workers by the database event broker"""
+    __tablename__ = 'order_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class Job(db.Model):
+    """Background task (e.g. a customer notification) run by the job queue"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers look for the next due pending job
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON string
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CacheVersion(db.Model):
+    """Version counter shared by all workers to invalidate in-memory caches"""
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class SchemaMigration(db.Model):
+    """One-time data migrations that have already been applied"""
+    __tablename__ = 'schema_migrations'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    details = db.Column(db.Text)
+
 class Settings(db.Model):
     __tablename__ = 'settings'
     
@@ -0,0 +1,112 @@
+"""Customer notifications for order events, delivered by the job queue.
+
+The transport is chosen with NOTIFICATION_BACKEND:
+- 'log' prints the messages (default)
+- 'fake' keeps them in memory, for tests
+- 'twilio' sends an SMS to the customer
+- 'webhook' posts the event as JSON to NOTIFICATION_WEBHOOK_URL
+"""
+from database import get_setting
+from jobs import job_queue
+from models import db, Order
+
+
+class LogSender:
+    def __init__(self, app):
+        pass
+    
+    def send(self, event, order, message):
+        print(f"Notification {event} for {order['tracking_code']}: {message}")
+
+
+class FakeSender:
+    """Records messages instead of sending them"""
+    
+    def __init__(self, app):
+        self.sent = []
+    
+    def send(self, event, order, message):
+        self.sent.append({'event': event, 'order': order, 'message': message})
+
+
+class TwilioSender:
+    def __init__(self, app):
+        from twilio.rest import Client
+        
+        self.client = Client(app.config['TWILIO_ACCOUNT_SID'], app.config['TWILIO_AUTH_TOKEN'])
+        self.from_number = app.config['TWILIO_FROM_NUMBER']
+        self.country_code = app.config['NOTIFICATION_COUNTRY_CODE']
+    
+    def send(self, event, order, message):
+        phone = (order.get('customer_phone') or '').replace(' ', '').replace('-', '')
+        if not phone:
+            return
+        if phone.startswith('0'):
+            # Local number, e.g. 06... -> +2126...
+            phone = f"+{self.country_code}{phone[1:]}"
+        self.client.messages.create(to=phone, from_=self.from_number, body=message)
+
+
+class WebhookSender:
+    def __init__(self, app):
+        import requests
+        
+        self.session = requests.Session()
+        self.url = app.config['NOTIFICATION_WEBHOOK_URL']
+    
+    def send(self, event, order, message):
+        response = self.session.post(self.url, json={'event': event, 'order': order, 'message': message},
+                                     timeout=10)
+        # Non-2xx raises, so the job is retried
+        response.raise_for_status()
+
+
+SENDERS = {
+    'log': LogSender,
+    'fake': FakeSender,
+    'twilio': TwilioSender,
+    'webhook': WebhookSender,
+}
+
+
+def init_notifications(app):
+    sender_class = SENDERS[app.config.get('NOTIFICATION_BACKEND', 'log')]
+    sender = sender_class(app)
+    app.extensions['notifier'] = sender
+    return sender
+
+
+def notify_order(event, order):
+    """Queue a notification for an order, committed with the order's own change.
+    
+    The order must have its id (flushed); the job is sent after the response.
+    """
+    job_queue.add(event, {'order_id': order.id, 'status': order.status})
+
+
+def order_message(event, order, status):
+    name = get_setting('restaurant_info', {}).get('name', '')
+    if event == 'order_placed':
+        return (f"{name}: تم استلام طلبك {order['order_number']}. "
+                f"رمز التتبع: {order['tracking_code']}")
+    return f"{name}: حالة طلبك {order['tracking_code']}: {status}"
+
+
+def send_order_notification(event, payload):
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        return
+    order = order.to_dict()
+    # The status at the time of the change, even if it changed again since
+    status = payload.get('status') or order['status']
+    job_queue.app.extensions['notifier'].send(event, order, order_message(event, order, status))
+
+
+@job_queue.handler('order_placed')
+def order_placed(payload):
+    send_order_notification('order_placed', payload)
+
+
+@job_queue.handler('order_status_changed')
+def order_status_changed(payload):
+    send_order_notification('order_status_changed', payload)
@@ -0,0 +1,177 @@
+"""Order placement, optionally group-committed.
+
+In 'batch' mode the orders placed by concurrent requests of a worker are
+queued and inserted by a single thread, one transaction per batch. A batch
+closes when it is full or when its first order has waited the latency
+budget. Each request blocks until its batch is committed, so it still gets
+its tracking code only once the order is stored. A request that gives up
+waiting raises OrderPending: its batch may still commit, so the caller must
+not place the order again.
+
+Functions registered with `on_placed` run for every committed order: in the
+placing request, or in the writer thread for an order whose request stopped
+waiting.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from models import db, Order
+from database import add_order_items, generate_tracking_code, save_new_order
+
+
+class OrderPending(Exception):
+    """The order was queued but not committed in time; it may still be stored"""
+    
+    def __init__(self, tracking_code):
+        super().__init__(f"Order {tracking_code} is not committed yet")
+        self.tracking_code = tracking_code
+
+
+class PendingOrder:
+    def __init__(self, values, items, categories, before_commit=None):
+        self.values = values
+        self.items = items
+        self.categories = categories
+        self.before_commit = before_commit
+        # Drawn up front so a request that stops waiting can still point to it
+        self.tracking_code = generate_tracking_code()
+        self.future = Future()
+    
+    def build(self):
+        order = Order(tracking_code=self.tracking_code, **self.values)
+        add_order_items(order, self.items, self.categories)
+        return order
+
+
+class OrderCommitter:
+    """Stores new orders, directly or in small batches"""
+    
+    def __init__(self):
+        self.app = None
+        self.mode = 'direct'
+        self.batch_size = 20
+        self.max_wait = 0.02
+        self.timeout = 10
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._placed_hooks = []
+    
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config['ORDER_COMMIT_MODE']
+        self.batch_size = app.config['ORDER_BATCH_SIZE']
+        self.max_wait = app.config['ORDER_BATCH_WAIT_MS'] / 1000
+        self.timeout = app.config['ORDER_COMMIT_TIMEOUT']
+    
+    def on_placed(self, func):
+        """Register a function called with each new order once it is committed"""
+        self._placed_hooks.append(func)
+        return func
+    
+    def place(self, values, items, categories, before_commit=None):
+        """Store a new order and return it, loaded in the current session.
+        
+        `values` are the Order columns except the tracking code, which is
+        drawn here; `items` are the priced cart lines. `before_commit(order)`
+        adds rows that belong to the order (its jobs) to its transaction.
+        """
+        pending = PendingOrder(values, items, categories, before_commit)
+        if self.mode != 'batch':
+            order = save_new_order(pending.build(), before_commit=before_commit)
+            self._placed(order)
+            return order
+        
+        # Give the request's connection back while waiting, so a busy pool
+        # cannot starve the writer
+        db.session.commit()
+
+        # Started lazily so no thread exists before gunicorn forks
+        self._ensure_writer()
+        self._queue.put(pending)
+        try:
+            order_id = pending.future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Whoever completes the future (the writer, or this thread if the
+            # batch just committed) runs the hooks; the request only reports it
+            pending.future.add_done_callback(self._placed_late)
+            raise OrderPending(pending.tracking_code)
+        order = db.session.get(Order, order_id)
+        self._placed(order)
+        return order
+    
+    def _placed(self, order):
+        for hook in self._placed_hooks:
+            try:
+                hook(order)
+            except Exception as e:
+                print(f"Order placed hook error for {order.tracking_code}: {e}")
+    
+    def _placed_late(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self.app.app_context():
+            self._placed(db.session.get(Order, future.result()))
+    
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._run, name='order-writer', daemon=True)
+            self._writer.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                with self.app.app_context():
+                    self._commit(batch)
+            except Exception as e:
+                print(f"Order writer error: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+    
+    def _commit(self, batch):
+        orders = [pending.build() for pending in batch]
+        try:
+            db.session.add_all(orders)
+            db.session.flush()
+            for pending, order in zip(batch, orders):
+                if pending.before_commit:
+                    pending.before_commit(order)
+            order_ids = [order.id for order in orders]
+            db.session.commit()
+        except Exception:
+            # A taken tracking code or one invalid order must not fail the
+            # whole batch: store the orders one by one instead
+            db.session.rollback()
+            for pending in batch:
+                self._commit_one(pending)
+            return
+        
+        for pending, order_id in zip(batch, order_ids):
+            pending.future.set_result(order_id)
+    
+    def _commit_one(self, pending):
+        try:
+            order = save_new_order(pending.build(), before_commit=pending.before_commit)
+            pending.future.set_result(order.id)
+        except Exception as e:
+            db.session.rollback()
+            pending.future.set_exception(e)
+
+
+order_committer = OrderCommitter()
@@ -0,0 +1,104 @@
+"""Full-response cache for anonymous, read-mostly pages.
+
+Entries are bounded by total body size (LRU) and validated by ETag and
+Last-Modified, so repeat visitors get 304s and first visitors skip the
+Jinja render whenever the cache key matches.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+from cache import CACHES
+
+
+class CachedPage:
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.last_modified = time.time()
+    
+    def __len__(self):
+        return len(self.body)
+
+
+class PageCache:
+    def __init__(self, name='pages', max_bytes=8 * 1024 * 1024):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+    
+    def get(self, key):
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+    
+    def set(self, key, body):
+        page = CachedPage(body)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = page
+            self.size += len(page)
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return page
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+page_cache = PageCache()
+
+
+def cached_page(key_func):
+    """Serve a GET view from page_cache under (endpoint, key_func(**view_args)).
+
+    key_func returns None when the page is personalised for this visitor
+    (flash messages, a cart badge, ...), which bypasses the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = key_func(**kwargs) if request.method == 'GET' else None
+            if key is None:
+                return view(*args, **kwargs)
+            
+            key = (request.endpoint,) + tuple(key)
+            page = page_cache.get(key)
+            if page is None:
+                body = view(*args, **kwargs)
+                if not isinstance(body, str):
+                    return body
+                page = page_cache.set(key, body.encode('utf-8'))
+            
+            response = make_response(page.body)
+            response.set_etag(page.etag)
+            response.last_modified = page.last_modified
+            # The page varies with the language stored in the session cookie
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
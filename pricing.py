@@ -0,0 +1,133 @@
+"""Server-side cart pricing for checkout and order placement.
+
+A quote reprices the cart against the catalog in one pass, then applies
+promotions, tax (app_settings.tax_rate, in percent, on the discounted
+subtotal), the delivery fee of the customer's position and the minimum
+order amount. All amounts are Decimals rounded to cents.
+
+Quotes are cached per cart lines, catalog version, settings revision and
+position, so placing an order reuses the quote shown at checkout.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from flask import current_app
+
+from cache import TTLCache
+from database import get_setting, settings_revision
+from delivery import delivery_zones
+
+CENT = Decimal('0.01')
+
+# Promotion rules: name -> function(quote, app_settings) returning a list of
+# (label, amount) discounts. Every registered rule runs on every quote.
+PROMOTIONS = {}
+
+
+def promotion(name):
+    """Register a promotion rule"""
+    def register(func):
+        PROMOTIONS[name] = func
+        return func
+    return register
+
+
+def money(value):
+    return Decimal(str(value or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class Quote:
+    """Itemized price of a cart"""
+    
+    def __init__(self, lines, app_settings, delivery):
+        self.lines = lines
+        self.subtotal = max(sum((line['line_total'] for line in lines), Decimal('0.00')), Decimal('0.00'))
+        self.discounts = []
+        
+        for name, rule in PROMOTIONS.items():
+            for label, amount in rule(self, app_settings) or ():
+                self.discounts.append({'promotion': name, 'label': label, 'amount': money(amount)})
+        # A discount is never negative and never makes the items cost less than nothing
+        discount = sum((d['amount'] for d in self.discounts), Decimal('0.00'))
+        self.discount = min(max(discount, Decimal('0.00')), self.subtotal)
+        
+        self.tax_rate = Decimal(str(app_settings.get('tax_rate') or 0))
+        self.tax = money((self.subtotal - self.discount) * self.tax_rate / 100)
+        
+        self.delivery = delivery
+        self.delivery_fee = money(delivery['fee']) if delivery['deliverable'] else None
+        self.total = self.subtotal - self.discount + self.tax + (self.delivery_fee or 0)
+        
+        self.min_order_amount = money(app_settings.get('min_order_amount'))
+        # The minimum applies to the items, not to tax or delivery
+        self.shortfall = max(self.min_order_amount - (self.subtotal - self.discount), Decimal('0.00'))
+    
+    @property
+    def deliverable(self):
+        return self.delivery['deliverable']
+    
+    @property
+    def meets_minimum(self):
+        return self.shortfall == 0
+    
+    def order_items(self):
+        """Lines as stored in Order.items"""
+        return [{
+            'id': line['id'],
+            'name': line['name'],
+            'price': float(line['price']),
+            'quantity': line['quantity'],
+            'image': line['image']
+        } for line in self.lines]
+    
+    def to_dict(self):
+        return {
+            'items': [dict(item, line_total=float(line['line_total']))
+                      for item, line in zip(self.order_items(), self.lines)],
+            'subtotal': float(self.subtotal),
+            'discounts': [dict(d, amount=float(d['amount'])) for d in self.discounts],
+            'discount': float(self.discount),
+            'tax_rate': float(self.tax_rate),
+            'tax': float(self.tax),
+            'delivery': self.delivery,
+            'delivery_fee': float(self.delivery_fee) if self.delivery_fee is not None else None,
+            'total': float(self.total),
+            'min_order_amount': float(self.min_order_amount),
+            'shortfall': float(self.shortfall),
+            'deliverable': self.deliverable,
+            'meets_minimum': self.meets_minimum
+        }
+
+
+def init_pricing(app):
+    """Create the quote cache, kept QUOTE_CACHE_SECONDS per cart state"""
+    quote_cache = TTLCache('pricing_quotes', ttl=app.config['QUOTE_CACHE_SECONDS'], maxsize=10000)
+    app.extensions['quote_cache'] = quote_cache
+    return quote_cache
+
+
+def price_lines(cart, catalog):
+    """The cart's lines with Decimal prices and line totals"""
+    lines = []
+    for line in cart.priced_lines(catalog):
+        # Carts only take positive quantities; never price anything else
+        if line['quantity'] < 1:
+            continue
+        price = money(line['price'])
+        lines.append(dict(line, price=price, line_total=price * line['quantity']))
+    return lines
+
+
+def quote_cart(cart, catalog, latitude=None, longitude=None):
+    """Quote of a cart, delivered to a position (None: flat delivery fee)"""
+    # Revalidate the settings the quote depends on before building its key
+    app_settings = get_setting('app_settings', {})
+    delivery_zones.index()
+    # Keyed on the lines, not the cart id: carts with the same lines share a quote
+    # and a transient anonymous cart adds no entry of its own
+    key = (tuple(sorted(cart.lines.items())), catalog.version,
+           settings_revision('app_settings'), settings_revision(delivery_zones.SETTING_KEY),
+           latitude, longitude)
+    
+    def build():
+        return Quote(price_lines(cart, catalog), app_settings, delivery_zones.quote(latitude, longitude))
+    return current_app.extensions['quote_cache'].get_or_set(key, build)
@@ -0,0 +1,195 @@
+"""In-memory full-text search over the menu.
+
+Every item's names, descriptions, categories and ingredients, in all
+languages, are normalized and tokenized into an inverted index. When the
+catalog version changes, only the items whose text changed are re-indexed.
+Query words match indexed words by prefix, so partial input already finds
+results.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+
+# Weight of a match per field; texts of every language are indexed
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'ingredients': 1.5,
+    'description': 1.0,
+}
+LANGUAGE_SUFFIXES = ('', '_fr')
+
+ARABIC_LETTERS = str.maketrans({
+    'ٱ': 'ا',  # alef wasla
+    'ى': 'ي',  # alef maksura
+    'ة': 'ه',  # teh marbuta
+    'ـ': None,  # tatweel
+})
+WORD = re.compile(r'\w+')
+
+# Definite article, alone or after a one-letter particle (و، ب، ك، ف، ل)
+ARTICLE_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+
+def normalize(text):
+    """Lowercase, without diacritics (Arabic harakat, French accents) or letter variants"""
+    # NFKD splits أ إ آ ؤ ئ and é, ç... into a base letter plus combining marks
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return stripped.translate(ARABIC_LETTERS)
+
+
+def strip_article(word):
+    for prefix in ARTICLE_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            return word[len(prefix):]
+    return word
+
+
+def tokenize(text):
+    return WORD.findall(normalize(text))
+
+
+def index_terms(text):
+    """Indexed words: each word, plus its form without the Arabic article"""
+    terms = []
+    for word in tokenize(text):
+        terms.append(word)
+        stripped = strip_article(word)
+        if stripped != word:
+            terms.append(stripped)
+    return terms
+
+
+def item_texts(item):
+    """The searchable text of an item, per field"""
+    texts = {}
+    for field in FIELD_WEIGHTS:
+        parts = []
+        for suffix in LANGUAGE_SUFFIXES:
+            value = item.get(field + suffix)
+            if isinstance(value, list):
+                parts.extend(str(part) for part in value)
+            elif value:
+                parts.append(str(value))
+        texts[field] = ' '.join(parts)
+    return texts
+
+
+class MenuSearchIndex:
+    def __init__(self):
+        self.version = None
+        self.postings = {}  # term -> {item_id: weight}
+        self.terms = []  # sorted vocabulary, for prefix lookups
+        self._documents = {}  # item_id -> indexed texts
+        self._item_terms = {}  # item_id -> {term: weight}
+        self._lock = threading.Lock()
+    
+    def update(self, snapshot):
+        """Re-index the items that changed since the last indexed version"""
+        with self._lock:
+            if snapshot.version == self.version:
+                return
+            vocabulary_changed = False
+            
+            for item_id in set(self._documents) - set(snapshot.items):
+                self._remove(item_id)
+                vocabulary_changed = True
+            
+            for item_id, item in snapshot.items.items():
+                texts = item_texts(item)
+                if self._documents.get(item_id) == texts:
+                    continue
+                self._remove(item_id)
+                self._add(item_id, texts)
+                vocabulary_changed = True
+            
+            if vocabulary_changed:
+                self.terms = sorted(self.postings)
+            self.version = snapshot.version
+    
+    def _add(self, item_id, texts):
+        weights = {}
+        for field, text in texts.items():
+            for term in index_terms(text):
+                weights[term] = max(weights.get(term, 0), FIELD_WEIGHTS[field])
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[item_id] = weight
+        self._documents[item_id] = texts
+        self._item_terms[item_id] = weights
+    
+    def _remove(self, item_id):
+        for term in self._item_terms.pop(item_id, {}):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(item_id, None)
+                if not postings:
+                    del self.postings[term]
+        self._documents.pop(item_id, None)
+    
+    def _matches(self, word):
+        """Best weight per item among the indexed terms starting with `word`"""
+        scores = {}
+        start = bisect.bisect_left(self.terms, word)
+        for term in self.terms[start:]:
+            if not term.startswith(word):
+                break
+            for item_id, weight in self.postings[term].items():
+                if weight > scores.get(item_id, 0):
+                    scores[item_id] = weight
+        return scores
+    
+    def search(self, snapshot, query='', language=None, category=None, min_price=None,
+               max_price=None, max_prep_time=None, available_only=True, limit=20):
+        """Items matching all query words and filters, best first.
+        
+        `snapshot` is the catalog snapshot (not a localized view, which only
+        carries one language); items are returned in `language`.
+        """
+        self.update(snapshot)
+        view = snapshot.localized(language) if language else snapshot
+        
+        words = []
+        for word in map(strip_article, tokenize(query or '')):
+            if word not in words:
+                words.append(word)
+        
+        if words:
+            with self._lock:
+                scores = None
+                for word in words:
+                    matches = self._matches(word)
+                    if scores is None:
+                        scores = matches
+                    else:
+                        scores = {item_id: score + matches[item_id]
+                                  for item_id, score in scores.items() if item_id in matches}
+                    if not scores:
+                        break
+            candidates = sorted(scores or {}, key=lambda item_id: (-scores[item_id], item_id))
+        else:
+            candidates = list(view.items)
+        
+        results = []
+        for item_id in candidates:
+            item = view.get_item(item_id)
+            if item is None:
+                continue
+            if available_only and not item['available']:
+                continue
+            if category and item['category_key'] != category:
+                continue
+            if min_price is not None and item['price'] < min_price:
+                continue
+            if max_price is not None and item['price'] > max_price:
+                continue
+            if max_prep_time is not None and (item['preparation_time'] or 0) > max_prep_time:
+                continue
+            results.append(item)
+            if len(results) == limit:
+                break
+        return results
+
+
+menu_search = MenuSearchIndex()
@@ -0,0 +1,126 @@
+"""Order statistics for the admin dashboard, aggregated in SQL."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func
+
+from cache import TTLCache
+from models import db, Order, OrderItem
+
+# Many admin tabs polling the dashboard share one computation per window
+stats_cache = TTLCache('order_stats', ttl=10, maxsize=32)
+
+
+def time_bucket(column, unit):
+    """SQL expression truncating a timestamp to a 'day' or 'hour' label"""
+    if db.engine.dialect.name == 'postgresql':
+        fmt = 'YYYY-MM-DD' if unit == 'day' else 'YYYY-MM-DD HH24:00'
+        return func.to_char(column, fmt)
+    fmt = '%Y-%m-%d' if unit == 'day' else '%Y-%m-%d %H:00'
+    return func.strftime(fmt, column)
+
+
+def revenue_by_bucket(unit, since):
+    """Order count and revenue per day or hour since `since`"""
+    bucket = time_bucket(Order.created_at, unit).label('bucket')
+    rows = (db.session.query(bucket, func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0))
+            .filter(Order.created_at >= since)
+            .group_by(bucket)
+            .order_by(bucket))
+    return [{'period': period, 'orders': count, 'revenue': float(revenue)}
+            for period, count, revenue in rows]
+
+
+def sales_query(group, date_from, date_to=None):
+    """Quantity and revenue from order_items grouped by item, category or hour"""
+    if group == 'item':
+        keys = (OrderItem.menu_item_id, OrderItem.name)
+    elif group == 'category':
+        keys = (OrderItem.category,)
+    elif group == 'hour':
+        keys = (time_bucket(OrderItem.created_at, 'hour').label('hour'),)
+    else:
+        raise ValueError(group)
+    
+    quantity = func.sum(OrderItem.quantity).label('quantity')
+    revenue = func.sum(OrderItem.price * OrderItem.quantity).label('revenue')
+    query = db.session.query(*keys, quantity, revenue).filter(OrderItem.created_at >= date_from)
+    if date_to:
+        query = query.filter(OrderItem.created_at < date_to + timedelta(days=1))
+    query = query.group_by(*keys)
+    return query.order_by(keys[0]) if group == 'hour' else query.order_by(quantity.desc())
+
+
+def get_sales(group, date_from, date_to=None, limit=None):
+    query = sales_query(group, date_from, date_to)
+    if limit:
+        query = query.limit(limit)
+    
+    sales = []
+    for row in query:
+        entry = {'quantity': int(row.quantity or 0), 'revenue': float(row.revenue or 0)}
+        if group == 'item':
+            entry.update(menu_item_id=row.menu_item_id, name=row.name)
+        elif group == 'category':
+            entry['category'] = row.category
+        else:
+            entry['hour'] = row.hour
+        sales.append(entry)
+    return sales
+
+
+def status_totals(since):
+    """Orders and revenue per status, overall and since `since`, in one grouped scan"""
+    recent = Order.created_at >= since
+    rows = (db.session.query(
+                Order.status,
+                func.count(Order.id),
+                func.coalesce(func.sum(Order.total_amount), 0),
+                func.count(case((recent, Order.id))),
+                func.coalesce(func.sum(case((recent, Order.total_amount))), 0),
+                func.max(Order.updated_at))
+            .group_by(Order.status))
+    
+    by_status = {}
+    window = {'orders': 0, 'sales': 0.0}
+    latest_update = None
+    for status, count, revenue, window_count, window_revenue, updated_at in rows:
+        by_status[status] = {'count': count, 'revenue': float(revenue)}
+        window['orders'] += window_count
+        window['sales'] += float(window_revenue)
+        if updated_at and (latest_update is None or updated_at > latest_update):
+            latest_update = updated_at
+    return by_status, window, latest_update
+
+
+def compute_dashboard_stats(days=7):
+    now = datetime.utcnow()
+    since = now - timedelta(days=days)
+    
+    by_status, window, latest_update = status_totals(since)
+    average_basket = (db.session.query(func.avg(Order.total_amount))
+                      .filter(Order.created_at >= since)
+                      .scalar())
+    
+    return {
+        'total_orders': sum(s['count'] for s in by_status.values()),
+        'pending_orders': by_status.get('جديد', {}).get('count', 0),
+        'completed_orders': by_status.get('تم التوصيل', {}).get('count', 0),
+        'total_sales': sum(s['revenue'] for s in by_status.values()),
+        'by_status': by_status,
+        'days': days,
+        'window_orders': window['orders'],
+        'window_sales': window['sales'],
+        'average_basket': float(average_basket or 0),
+        'revenue_per_day': revenue_by_bucket('day', since),
+        'revenue_per_hour': revenue_by_bucket('hour', now - timedelta(hours=24)),
+        'top_items': get_sales('item', since, limit=5),
+        'sales_by_category': get_sales('category', since),
+        # Cursor of the admin's live feed; a few seconds behind only re-sends orders
+        'latest_update': latest_update.isoformat() if latest_update else None,
+        'generated_at': now.isoformat()
+    }
+
+
+def get_dashboard_stats(days=7):
+    """Dashboard statistics, cached for a few seconds per window size"""
+    return stats_cache.get_or_set(days, lambda: compute_dashboard_stats(days))
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from jobs import job_queue  # noqa: E402
+from models import db  # noqa: E402
+from notifications import init_notifications  # noqa: E402
+from ordercommit import order_committer  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """A bare app on an in-memory database, with job workers off"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        JOB_WORKERS=0,
+        JOB_MAX_ATTEMPTS=3,
+        JOB_BACKOFF_SECONDS=10,
+        JOB_MAX_BACKOFF_SECONDS=60,
+        JOB_LOCK_TIMEOUT=300,
+        NOTIFICATION_BACKEND='fake',
+        ORDER_COMMIT_MODE='direct',
+    )
+    db.init_app(app)
+    job_queue.init_app(app)
+    order_committer.init_app(app)
+    init_notifications(app)
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import job_queue
+from models import db, Job, Order
+from notifications import notify_order
+from ordercommit import order_committer
+
+
+def order_values(**values):
+    return dict({
+        'customer_name': 'Test',
+        'customer_phone': '0600000000',
+        'customer_address': 'Meknes',
+        'items': '[]',
+        'total_amount': 50.0,
+        'status': 'جديد',
+    }, **values)
+
+
+def run_next():
+    """Claim and run the next due job, returning its id"""
+    job_id = job_queue._claim()
+    assert job_id is not None
+    job_queue._run(job_id)
+    return job_id
+
+
+def make_due(job_id):
+    db.session.get(Job, job_id).run_at = datetime.utcnow()
+    db.session.commit()
+
+
+@pytest.fixture
+def failing_handler(monkeypatch):
+    calls = []
+    
+    def handler(payload):
+        calls.append(payload)
+        raise RuntimeError('sender down')
+    monkeypatch.setitem(job_queue.handlers, 'test_failing', handler)
+    return calls
+
+
+def test_failed_job_is_retried_with_backoff(app, failing_handler):
+    job_id = job_queue.enqueue('test_failing', {'n': 1}).id
+    started = datetime.utcnow()
+    
+    assert run_next() == job_id
+    job = db.session.get(Job, job_id)
+    assert failing_handler == [{'n': 1}]
+    assert job.status == 'pending'
+    assert job.attempts == 1
+    assert job.locked_at is None
+    assert job.last_error == 'RuntimeError: sender down'
+    # First retry after JOB_BACKOFF_SECONDS, with ±20% jitter
+    delay = (job.run_at - started).total_seconds()
+    assert 8 <= delay <= 12 + 1
+    # Not claimed again before it is due
+    assert job_queue._claim() is None
+
+
+def test_backoff_doubles_up_to_the_maximum(app):
+    assert 8 <= job_queue._backoff(1) <= 12
+    assert 16 <= job_queue._backoff(2) <= 24
+    assert 32 <= job_queue._backoff(3) <= 48
+    assert 48 <= job_queue._backoff(10) <= 72
+
+
+def test_job_fails_after_max_attempts(app, failing_handler):
+    job_id = job_queue.enqueue('test_failing', {}).id
+    
+    for attempt in range(1, 4):
+        make_due(job_id)
+        run_next()
+        assert db.session.get(Job, job_id).attempts == attempt
+    
+    job = db.session.get(Job, job_id)
+    assert job.status == 'failed'
+    assert len(failing_handler) == 3
+    make_due(job_id)
+    assert job_queue._claim() is None
+
+
+def test_unknown_kind_is_an_error(app):
+    job_id = job_queue.enqueue('test_unknown', {}).id
+    run_next()
+    assert 'LookupError' in db.session.get(Job, job_id).last_error
+
+
+def test_stale_running_job_is_reclaimed_after_lock_timeout(app):
+    job_id = job_queue.enqueue('test_failing', {}).id
+    assert job_queue._claim() == job_id
+    # Its worker died while running it
+    
+    job_queue._last_recovery = None
+    job_queue._recover_stale()
+    assert db.session.get(Job, job_id).status == 'running'
+    assert job_queue._claim() is None
+    
+    job = db.session.get(Job, job_id)
+    job.locked_at = datetime.utcnow() - timedelta(seconds=301)
+    db.session.commit()
+    job_queue._last_recovery = None
+    job_queue._recover_stale()
+    
+    job = db.session.get(Job, job_id)
+    assert job.status == 'pending'
+    assert job.locked_at is None
+    assert job_queue._claim() == job_id
+    assert db.session.get(Job, job_id).attempts == 2
+
+
+def test_order_notification_is_sent_with_fake_sender(app):
+    order = order_committer.place(order_values(), [], lambda item_id: None,
+                                  before_commit=lambda new_order: notify_order('order_placed', new_order))
+    
+    job = Job.query.one()
+    assert job.kind == 'order_placed'
+    run_next()
+    
+    sent = app.extensions['notifier'].sent
+    assert [message['event'] for message in sent] == ['order_placed']
+    assert sent[0]['order']['tracking_code'] == order.tracking_code
+    assert order.tracking_code in sent[0]['message']
+    assert db.session.get(Job, job.id).status == 'done'
+
+
+def test_notification_job_commits_with_the_order(app):
+    job_queue._wakeup.clear()
+    order = Order(tracking_code='TESTCODE01', **order_values())
+    db.session.add(order)
+    db.session.flush()
+    notify_order('order_placed', order)
+    
+    # Rolled back together: no job for an order that was never stored
+    db.session.rollback()
+    assert Job.query.count() == 0
+    assert not job_queue._wakeup.is_set()
+    
+    order = Order(tracking_code='TESTCODE02', **order_values())
+    db.session.add(order)
+    db.session.flush()
+    notify_order('order_placed', order)
+    db.session.commit()
+    assert Job.query.one().payload == f'{{"order_id": {order.id}, "status": "جديد"}}'
+    # A local worker is woken once the transaction commits
+    assert job_queue._wakeup.is_set()
@@ -0,0 +1,133 @@
+"""Streaming NDJSON import/export of orders and the menu.
+
+One JSON document per line keeps memory bounded for files of any size:
+rows are read and written in batches and every import batch is committed
+on its own, so an interrupted import can resume from the last reported
+line offset.
+"""
+import json
+import sys
+import time
+
+from sqlalchemy import insert, text
+
+from database import menu_item_row, order_row, backfill_order_items, bump_cache_version
+from models import db, MenuItem, Order
+
+
+class Progress:
+    """Periodic count and throughput report on stderr"""
+    
+    def __init__(self, label, out=sys.stderr):
+        self.label = label
+        self.out = out
+        self.count = 0
+        self.started = time.perf_counter()
+    
+    def add(self, count, position=None):
+        self.count += count
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed else 0
+        where = f", line {position}" if position is not None else ""
+        print(f"{self.label}: {self.count} rows ({rate:.0f} rows/s{where})", file=self.out)
+    
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return f"{self.label}: {self.count} rows in {elapsed:.2f}s"
+
+
+def export_orders(out, batch_size=1000):
+    """Write every order as one JSON line, oldest first"""
+    progress = Progress('Exported orders')
+    last_id = 0
+    while True:
+        batch = (Order.query
+                 .filter(Order.id > last_id)
+                 .order_by(Order.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        for order in batch:
+            out.write(json.dumps(order.to_dict(), ensure_ascii=False) + '\n')
+        last_id = batch[-1].id
+        progress.add(len(batch))
+        # Keep the identity map from growing with the export
+        db.session.expunge_all()
+    return progress
+
+
+def export_menu(out):
+    progress = Progress('Exported menu items')
+    items = MenuItem.query.order_by(MenuItem.id).all()
+    for item in items:
+        out.write(json.dumps(item.to_dict(), ensure_ascii=False) + '\n')
+    progress.add(len(items))
+    return progress
+
+
+def read_batches(lines, batch_size, resume_from=0):
+    """Yield (end_line, documents) batches, skipping the first resume_from lines"""
+    batch = []
+    line_number = 0
+    for line_number, line in enumerate(lines, start=1):
+        if line_number <= resume_from or not line.strip():
+            continue
+        batch.append(json.loads(line))
+        if len(batch) >= batch_size:
+            yield line_number, batch
+            batch = []
+    if batch:
+        yield line_number, batch
+
+
+def import_orders(lines, batch_size=1000, resume_from=0):
+    """Insert orders from NDJSON lines, skipping tracking codes already present"""
+    progress = Progress('Imported orders')
+    for end_line, documents in read_batches(lines, batch_size, resume_from):
+        rows = {}
+        for document in documents:
+            row = order_row(document)
+            rows.setdefault(row['tracking_code'], row)
+        
+        existing = {code for (code,) in db.session.query(Order.tracking_code)
+                    .filter(Order.tracking_code.in_(list(rows)))}
+        new_rows = [row for code, row in rows.items() if code not in existing]
+        if new_rows:
+            db.session.execute(insert(Order), new_rows)
+        db.session.commit()
+        
+        # Lines up to end_line are durable: --resume-from end_line continues here
+        progress.add(len(new_rows), end_line)
+    
+    backfill_order_items(batch_size=batch_size)
+    return progress
+
+
+def import_menu(lines, batch_size=500, resume_from=0):
+    """Insert menu items from NDJSON lines, keeping ids and skipping existing ones"""
+    progress = Progress('Imported menu items')
+    for end_line, documents in read_batches(lines, batch_size, resume_from):
+        rows = [menu_item_row(document) for document in documents]
+        ids = [row['id'] for row in rows if row['id'] is not None]
+        existing = {item_id for (item_id,) in db.session.query(MenuItem.id).filter(MenuItem.id.in_(ids))}
+        new_rows = [row for row in rows if row['id'] is None or row['id'] not in existing]
+        if new_rows:
+            db.session.execute(insert(MenuItem), new_rows)
+        bump_cache_version('menu')
+        db.session.commit()
+        progress.add(len(new_rows), end_line)
+    
+    sync_id_sequence(MenuItem.__tablename__)
+    return progress
+
+
+def sync_id_sequence(table):
+    """Move a PostgreSQL id sequence past ids inserted explicitly"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    db.session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+    ))
+    db.session.commit()